@@ -0,0 +1,153 @@
+from array import array
+from collections.abc import Mapping
+from itertools import chain
+
+import numpy as np
+
+
+class KeySet:
+    # distinct uint64 keys, kept as sorted unique arrays merged lazily
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.pending = []
+        self.pending_size = 0
+
+    def add(self, keys):
+        keys = np.unique(keys)
+        self.pending.append(keys)
+        self.pending_size += len(keys)
+        if self.pending_size > max(len(self.keys), 1 << 16):
+            self.compact()
+
+    def compact(self):
+        self.keys = np.unique(np.concatenate([self.keys] + self.pending))
+        self.pending = []
+        self.pending_size = 0
+
+    def unique(self):
+        self.compact()
+        return self.keys
+
+
+class CSRAdjacency(Mapping):
+    # read-only {key: [key_next,...]} over sorted keys, offsets and concatenated values
+
+    def __init__(self, keys, ptr, values):
+        self.keys_array = keys
+        self.ptr = ptr
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, flag):
+        # compact a {key: {key_next,...}} Flag dict
+        keys = np.fromiter(flag, dtype=np.int64, count=len(flag))
+        counts = np.fromiter(map(len, flag.values()), dtype=np.int64, count=len(flag))
+        values = np.fromiter(chain.from_iterable(flag.values()), dtype=np.int64, count=int(counts.sum()))
+        # sort the edges by key then key_next through the rank of each key
+        order = np.argsort(keys)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(keys))
+        edges = np.argsort(np.repeat(rank, counts) * (int(values.max(initial=0)) + 1) + values)
+        ptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum(counts[order])
+        return cls(keys[order].astype(np.uint32), ptr, values[edges].astype(np.uint32))
+
+    @classmethod
+    def from_codes(cls, codes, p_next):
+        # compact sorted unique edge codes key * p_next + key_next
+        keys, start = np.unique(codes // np.uint64(p_next), return_index=True)
+        ptr = np.append(start, len(codes)).astype(np.int64)
+        return cls(keys.astype(np.uint32), ptr, (codes % np.uint64(p_next)).astype(np.uint32))
+
+    def index(self, key):
+        # position of the key, -1 if absent
+        k = int(np.searchsorted(self.keys_array, key))
+        if k < len(self.keys_array) and self.keys_array[k] == key:
+            return k
+        return -1
+
+    def expand(self, keys):
+        # every (position in keys, key_next) edge of an array of keys, grouped by position in order
+        if len(self.keys_array) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        k = np.searchsorted(self.keys_array, keys)
+        k[k == len(self.keys_array)] = 0
+        found = self.keys_array[k] == keys
+        counts = np.where(found, self.ptr[k + 1] - self.ptr[k], 0)
+        parent = np.repeat(np.arange(len(keys)), counts)
+        first = np.cumsum(counts) - counts
+        positions = np.repeat(self.ptr[k] - first, counts) + np.arange(len(parent))
+        return parent, self.values[positions].astype(np.int64)
+
+    def contains_edges(self, keys, keys_next, p_next):
+        # mask of the (key, key_next) pairs that are edges
+        codes = np.repeat(self.keys_array.astype(np.int64), np.diff(self.ptr)) * p_next + self.values
+        queries = keys * p_next + keys_next
+        k = np.searchsorted(codes, queries)
+        k[k == len(codes)] = 0
+        return codes[k] == queries if len(codes) else np.zeros(len(queries), dtype=bool)
+
+    def __getitem__(self, key):
+        k = self.index(key)
+        if k < 0:
+            raise KeyError(key)
+        return self.values[self.ptr[k]:self.ptr[k + 1]].tolist()
+
+    def __contains__(self, key):
+        return self.index(key) >= 0
+
+    def __iter__(self):
+        return iter(self.keys_array.tolist())
+
+    def __len__(self):
+        return len(self.keys_array)
+
+
+class EdgeLog(KeySet):
+    # Flag edges recorded as uint64 codes key * p_next + key_next during ingestion,
+    # compacted into a CSRAdjacency when the epoch is analyzed
+
+    def __init__(self, p_next):
+        super().__init__()
+        self.p_next = p_next
+        self.buffer = array('Q')    # codes of single edges added by update
+        self.adjacency = None       # CSRAdjacency of the codes, until the next edge is added
+
+    def add_edges(self, keys, keys_next):
+        self.add(keys.astype(np.uint64) * np.uint64(self.p_next) + keys_next.astype(np.uint64))
+        self.adjacency = None
+
+    def add_edge(self, key, key_next):
+        self.buffer.append(key * self.p_next + key_next)
+        if len(self.buffer) >= 1 << 16:
+            codes = np.frombuffer(self.buffer, dtype=np.uint64)
+            self.buffer = array('Q')
+            self.add(codes)
+        self.adjacency = None
+
+    def compact(self):
+        if self.buffer:
+            self.pending.append(np.unique(np.frombuffer(self.buffer, dtype=np.uint64)))
+            self.buffer = array('Q')
+        super().compact()
+
+    def csr(self):
+        # the edges as a CSRAdjacency, cached until the next edge is added
+        if self.adjacency is None:
+            self.adjacency = CSRAdjacency.from_codes(self.unique(), self.p_next)
+        return self.adjacency
+
+    def clear(self):
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.pending = []
+        self.pending_size = 0
+        self.buffer = array('Q')
+        self.adjacency = None
+
+    def __len__(self):
+        return len(self.unique())
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + self.keys.nbytes + sum(keys.nbytes for keys in self.pending) +
+                self.buffer.buffer_info()[1] * self.buffer.itemsize)
@@ -0,0 +1,160 @@
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from codec import decs2addr
+from detect import detect_anomalies
+from main import P_SETS, U_SETS
+from stream import TraceStats
+from supersketch import SuperSketch
+
+
+def random_addrs(rng, size):
+    # random unicast-looking IPv4 addresses
+    return rng.integers(1 << 24, 224 << 24, size=size, dtype=np.int64)
+
+
+def generate_trace(num_flows=200000, epochs=2, num_sources=20000, num_destinations=20000, spreaders=5,
+                   receivers=5, changers=3, fanout=None, seed=1):
+    # synthetic epochs of (src, des, port) flows with injected super spreaders, receivers and changers
+    # changers are silent in the first epoch and spread from the second one, so they are spreaders too
+    rng = np.random.default_rng(seed)
+    fanout = fanout or max(1, num_flows // 100)
+    sources = random_addrs(rng, num_sources)
+    destinations = random_addrs(rng, num_destinations)
+    spreader_addrs = random_addrs(rng, spreaders)
+    receiver_addrs = random_addrs(rng, receivers)
+    changer_addrs = random_addrs(rng, changers)
+    ports = np.array([22, 23, 53, 80, 123, 443, 445, 3389, 8080], dtype=np.int64)
+
+    trace = []
+    for epoch in range(epochs):
+        background = num_flows - fanout * (spreaders + receivers + (changers if epoch else 0))
+        src = [rng.choice(sources, background)]
+        des = [rng.choice(destinations, background)]
+        port = [np.where(rng.random(background) < 0.8, rng.choice(ports, background),
+                         rng.integers(1, 65536, background))]
+        active = list(spreader_addrs) + (list(changer_addrs) if epoch else [])
+        for addr in active:
+            src.append(np.full(fanout, addr))
+            des.append(random_addrs(rng, fanout))
+            port.append(rng.integers(1, 65536, fanout))
+        for addr in receiver_addrs:
+            src.append(random_addrs(rng, fanout))
+            des.append(np.full(fanout, addr))
+            port.append(rng.choice(ports, fanout))
+        src, des, port = np.concatenate(src), np.concatenate(des), np.concatenate(port)
+        order = rng.permutation(len(src))
+        trace.append((src[order], des[order], port[order]))
+
+    truth = {
+        'spreader_real': decs2addr(np.concatenate([spreader_addrs, changer_addrs]) if epochs > 1 else spreader_addrs),
+        'receiver_real': decs2addr(receiver_addrs),
+        'changer_real': decs2addr(changer_addrs) if epochs > 1 else [],
+    }
+    return trace, truth
+
+
+def write_trace(trace, path):
+    # write the epochs as CSV files for Experiment, one file per epoch
+    os.makedirs(path, exist_ok=True)
+    for epoch, (src, des, port) in enumerate(trace):
+        pd.DataFrame({'Src IP': decs2addr(src), 'Dst IP': decs2addr(des), 'Dst Port': port}).to_csv(
+            os.path.join(path, 'epoch%03d.csv' % epoch), index=False)
+
+
+def timed(func, *args):
+    # result and wall time in seconds of func(*args)
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_config(trace, truth, n, p, u, storage='dict', queries=1000, scalar_flows=20000, hot_threshold=None):
+    # throughput, latency, detection time, memory, estimation error and detection quality of one configuration
+    ssketch = SuperSketch(n, p, u, storage, hot_threshold=hot_threshold)
+    result = {'p': p[0], 'u': u[0], 'n': n, 'storage': storage, 'hot': hot_threshold, 'update_batch': 0.0, 'ingest': 0.0,
+              'detect': 0.0, 'abrow': 0.0, 'abcol': 0.0, 'recon': 0.0}
+    found = {'spreaders': set(), 'receivers': set(), 'changers': set()}
+    flows = 0
+    for src, des, port in trace:
+        ssketch.clear()
+        _, seconds = timed(ssketch.update_batch, src, des, port)
+        result['ingest'] += seconds
+        flows += len(src)
+        result['bytes_per_flow'] = ssketch.memory_usage() / len(src)
+
+        # per-query latency on addresses of the trace
+        sample_src = src[:queries].tolist()
+        sample_des = des[:queries].tolist()
+        for name, func, sample in (('cal_dc', ssketch.cal_dc, sample_src), ('cal_dpc', ssketch.cal_dpc, sample_src),
+                                   ('cal_sc', ssketch.cal_sc, sample_des)):
+            _, seconds = timed(lambda: [func(x) for x in sample])
+            result[name + '_us'] = seconds / len(sample) * 1e6
+        _, seconds = timed(ssketch.cal_dc_many, src)
+        result['cal_dc_many_us'] = seconds / len(src) * 1e6
+
+        # mean relative error of the estimates over every address of the epoch
+        stats = TraceStats()
+        stats.update(src, des, port)
+        for name, func, (addrs, real) in (('dc', ssketch.cal_dc_many, stats.dc()),
+                                          ('dpc', ssketch.cal_dpc_many, stats.dpc()),
+                                          ('sc', ssketch.cal_sc_many, stats.sc())):
+            result['are_' + name] = float((np.abs(func(addrs) - real) / real).mean())
+
+        # end-of-epoch detection, split into its stages on a copy of the state
+        pre_row_dict = ssketch.pre_row_dict
+        (abrow_spreader, abrow_changer), result['abrow'] = timed(ssketch.cal_abrow_list)
+        abcol_receiver, result['abcol'] = timed(ssketch.cal_abcol_list)
+        _, result['recon'] = timed(lambda: (ssketch.recon_sip(abrow_spreader), ssketch.recon_sip(abrow_changer)
+                                            if abrow_changer else [], ssketch.recon_dip(abcol_receiver)))
+        ssketch.pre_row_dict = pre_row_dict
+        report, seconds = timed(detect_anomalies, ssketch)
+        result['detect'] = max(result['detect'], seconds)
+        for key in found:
+            found[key].update(report[key])
+    result['update_batch'] = flows / result.pop('ingest')
+
+    # per-row update path on a slice of the first epoch
+    scalar = SuperSketch(n, p, u, storage, hot_threshold=hot_threshold)
+    scalar.initialize()
+    src, des, port = (x[:scalar_flows].tolist() for x in trace[0])
+    _, seconds = timed(lambda: [scalar.update(*flow) for flow in zip(src, des, port)])
+    result['update'] = len(src) / seconds
+
+    # peak memory of ingesting the first epoch
+    tracemalloc.start()
+    peak = SuperSketch(n, p, u, storage, hot_threshold=hot_threshold)
+    peak.initialize()
+    peak.update_batch(*trace[0])
+    result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+
+    for key, real in (('spreaders', 'spreader_real'), ('receivers', 'receiver_real'), ('changers', 'changer_real')):
+        result[key + '_missed'] = len(set(truth[real]) - found[key])
+        result[key + '_extra'] = len(found[key] - set(truth[real]))
+    return result
+
+
+def run(num_flows=200000, epochs=2, n=5, storages=('dict', 'compact'), hot_thresholds=(None, 64), seed=1):
+    # sweep the prime sets of main.py and print one line per configuration
+    # hot=None is the exact mode, the other thresholds show what bounding the hot rows costs
+    trace, truth = generate_trace(num_flows, epochs, seed=seed)
+    results = []
+    for p_set in P_SETS:
+        for u_set in U_SETS:
+            for storage in storages:
+                for hot_threshold in hot_thresholds:
+                    result = bench_config(trace, truth, n, p_set[:n], u_set[:n], storage,
+                                          hot_threshold=hot_threshold)
+                    results.append(result)
+                    print(' '.join('%s=%s' % (key, round(value, 3) if isinstance(value, float) else value)
+                                   for key, value in result.items()), flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,62 @@
+from functools import lru_cache
+import socket
+
+import numpy as np
+
+
+@lru_cache(maxsize=65536)
+def parse_addr(addr):
+    # Dotted decimal notation IP to Decimal integer IP, memoized for repeated lookups
+    a, b, c, d = (int(octet) for octet in addr.split("."))
+    if not (0 <= a <= 255 and 0 <= b <= 255 and 0 <= c <= 255 and 0 <= d <= 255):
+        raise ValueError('invalid dotted decimal IP address: %r' % (addr,))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def addr2dec(addr):
+    # Dotted decimal notation IP  to Decimal integer IP, integer IPs are returned unchanged
+    if isinstance(addr, (int, np.integer)):
+        return int(addr)
+    return parse_addr(addr)
+
+
+def dec2addr(dec):
+    # Decimal integer IP TO Dotted decimal notation IP
+    return socket.inet_ntoa((int(dec) & 0xffffffff).to_bytes(4, 'big'))
+
+
+def addrs2dec(addrs):
+    # array of dotted decimal (or integer) IPs to an int64 array of decimal integer IPs in one pass
+    addrs = np.asarray(addrs)
+    if addrs.dtype.kind in 'iu':
+        return addrs.astype(np.int64)
+    if len(addrs) == 0:
+        return np.zeros(0, dtype=np.int64)
+    chars = np.asarray(addrs, dtype='S')
+    width = chars.dtype.itemsize
+    chars = chars.view(np.uint8).reshape(-1, width).astype(np.int64)
+    digit = (chars >= 48) & (chars <= 57)
+    dot = chars == 46
+    if width > 15 or not (digit | dot | (chars == 0)).all() or not (dot.sum(axis=1) == 3).all():
+        raise ValueError('invalid dotted decimal IP address in input')
+    dec = np.zeros(len(chars), dtype=np.int64)
+    octet = np.zeros(len(chars), dtype=np.int64)
+    digits = np.zeros(len(chars), dtype=np.int64)   # digits of the current octet, 0 for an empty one
+    bad = np.zeros(len(chars), dtype=bool)
+    for j in range(width):
+        octet = np.where(digit[:, j], octet * 10 + chars[:, j] - 48, octet)
+        digits += digit[:, j]
+        bad |= dot[:, j] & ((digits == 0) | (octet > 255))
+        dec = np.where(dot[:, j], (dec << 8) | octet, dec)
+        octet[dot[:, j]] = 0
+        digits[dot[:, j]] = 0
+    # the same octets as addr2dec rejects: empty or above 255
+    if (bad | (digits == 0) | (octet > 255)).any():
+        raise ValueError('invalid dotted decimal IP address in input')
+    return (dec << 8) | octet
+
+
+def decs2addr(decs):
+    # array of decimal integer IPs to a list of dotted decimal IPs
+    packed = np.asarray(decs).astype('>u4').tobytes()
+    return [socket.inet_ntoa(packed[i:i + 4]) for i in range(0, len(packed), 4)]
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import struct
+import time
+
+import numpy as np
+
+from readers import NETFLOW5_HEADER, NETFLOW5_RECORD, decode_netflow5, encode_netflow5
+from stream import iter_batches
+
+HEADER = struct.Struct('>HHIIIIBBH')
+
+
+class Collector(asyncio.DatagramProtocol):
+    # NetFlow v5 collector feeding a WindowedDetector or DoubleBufferedDetector
+    # the receive loop only checks and buffers datagrams, decoding and ingestion run in a worker thread
+
+    def __init__(self, detector, batch_size=1 << 14, flush_interval=0.5, max_pending=8, reorder_records=1 << 12,
+                 reorder_ms=10000):
+        self.detector = detector
+        self.batch_size = batch_size            # records decoded and ingested together
+        self.flush_interval = flush_interval    # seconds after which a partial batch is ingested anyway
+        self.max_pending = max_pending          # batches waiting for ingestion before new ones are dropped
+        self.reorder_records = reorder_records  # a datagram further behind in the flow sequence is a restart
+        self.reorder_ms = reorder_ms            # and so is a drop of the exporter uptime by more than this
+        self.buffer = []
+        self.buffered = 0
+        self.sequences = {}     # (exporter, engine type, engine id): (next expected flow sequence number, uptime)
+        self.datagrams = 0
+        self.records = 0
+        self.lost = 0           # records missing from the flow sequence of the exporters, less the late ones
+        self.dropped = 0        # records dropped because ingestion fell behind
+        self.malformed = 0      # datagrams that are not NetFlow v5
+        self.reordered = 0      # datagrams older than the last one of their exporter
+        self.restarts = 0       # exporters seen starting their flow sequence over
+        self.transport = None
+        self.queue = None
+        self.consumer = None
+        self.timer = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < NETFLOW5_HEADER:
+            self.malformed += 1
+            return
+        version, count, uptime, _, _, sequence, engine_type, engine_id, _ = HEADER.unpack_from(data)
+        size = NETFLOW5_HEADER + NETFLOW5_RECORD * count
+        if version != 5 or len(data) < size:
+            self.malformed += 1
+            return
+        self.datagrams += 1
+        self.records += count
+        exporter = (addr[0], engine_type, engine_id)
+        expected, last_uptime = self.sequences.get(exporter, (None, None))
+        gap = 0 if expected is None else (sequence - expected) & 0xFFFFFFFF
+        if expected is not None and (uptime + self.reorder_ms < last_uptime or
+                                     gap >= 1 << 31 and (1 << 32) - gap > self.reorder_records):
+            # the exporter restarted and its sequence started over: resync on this datagram
+            self.restarts += 1
+            gap = 0
+        if gap >= 1 << 31:
+            # a late datagram fills part of a gap counted as lost when a later one arrived
+            self.reordered += 1
+            self.lost = max(0, self.lost - count)
+        else:
+            self.lost += gap
+            self.sequences[exporter] = ((sequence + count) & 0xFFFFFFFF, uptime)
+        self.buffer.append(data[:size])
+        self.buffered += count
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # hand the buffered datagrams to the ingestion worker, or drop them if it is too far behind
+        if not self.buffer:
+            return
+        batch = b''.join(self.buffer)
+        records = self.buffered
+        self.buffer = []
+        self.buffered = 0
+        try:
+            self.queue.put_nowait((batch, records))
+        except asyncio.QueueFull:
+            self.dropped += records
+
+    def tick(self):
+        self.flush()
+        self.timer = asyncio.get_running_loop().call_later(self.flush_interval, self.tick)
+
+    def ingest(self, batch):
+        # worker thread: decode a batch of datagrams and feed the flows to the detector
+        src, des, port = decode_netflow5(batch)
+        self.detector.feed(src, des, port)
+
+    async def consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            await loop.run_in_executor(self.executor, self.ingest, item[0])
+
+    async def start(self, host='0.0.0.0', port=2055, receive_buffer=1 << 24):
+        # listen on host:port
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        sock.bind((host, port))
+        await loop.create_datagram_endpoint(lambda: self, sock=sock)
+        self.consumer = asyncio.ensure_future(self.consume())
+        self.timer = loop.call_later(self.flush_interval, self.tick)
+        return self.transport.get_extra_info('sockname')
+
+    async def stop(self):
+        # stop listening, ingest what is left and close the last window
+        self.transport.close()
+        self.timer.cancel()
+        self.flush()
+        await self.queue.put(None)
+        await self.consumer
+        loop = asyncio.get_running_loop()
+        close = getattr(self.detector, 'close', self.detector.flush)
+        await loop.run_in_executor(self.executor, close)
+        self.executor.shutdown()
+
+    def counters(self):
+        return {
+            'datagrams': self.datagrams,
+            'records': self.records,
+            'lost': self.lost,
+            'dropped': self.dropped,
+            'malformed': self.malformed,
+            'reordered': self.reordered,
+            'restarts': self.restarts,
+            'pending': self.queue.qsize() if self.queue is not None else 0,
+        }
+
+
+def replay(path, host='127.0.0.1', port=2055, rate=None, chunksize=1 << 16):
+    # send the flows of a trace file as NetFlow v5 datagrams, at most rate datagrams per second
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sequence = 0
+    sent = 0
+    start = time.perf_counter()
+    for src, des, dport in iter_batches(path, chunksize):
+        for datagram in encode_netflow5(src, des, dport, np.full(len(src), time.time()), sequence):
+            sock.sendto(datagram, (host, port))
+            sent += 1
+            if rate is not None:
+                delay = start + sent / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        sequence += len(src)
+    sock.close()
+    return sent
+
+
+async def serve(detector, host='0.0.0.0', port=2055, duration=None, report_interval=10.0):
+    # run a collector until cancelled or for duration seconds, printing its counters
+    collector = Collector(detector)
+    await collector.start(host, port)
+    begin = time.monotonic()
+    try:
+        while duration is None or time.monotonic() - begin < duration:
+            await asyncio.sleep(report_interval if duration is None else min(report_interval, duration))
+            print(collector.counters(), flush=True)
+    finally:
+        await collector.stop()
+    return collector
+
+
+if __name__ == '__main__':
+    from main import P_SETS, U_SETS
+    from supersketch import SuperSketch
+    from window import DoubleBufferedDetector
+
+    parser = argparse.ArgumentParser(description='NetFlow v5 collector for SuperSketch and its loopback replay tool')
+    parser.add_argument('command', choices=['listen', 'replay'])
+    parser.add_argument('trace', nargs='?', help='CSV, pcap or NetFlow v5 trace to replay')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2055)
+    parser.add_argument('--window', type=float, default=60.0, help='seconds per detection window')
+    parser.add_argument('--rate', type=float, help='datagrams per second to replay')
+    args = parser.parse_args()
+    if args.command == 'replay':
+        print('%d datagrams sent' % replay(args.trace, args.host, args.port, args.rate))
+    else:
+        detector = DoubleBufferedDetector([SuperSketch(5, P_SETS[3][:5], U_SETS[1][:5]) for i in range(2)],
+                                          window_seconds=args.window,
+                                          on_report=lambda report: print(report, flush=True))
+        asyncio.run(serve(detector, args.host, args.port))
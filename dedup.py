@@ -0,0 +1,106 @@
+import math
+
+import numpy as np
+
+MASK64 = (1 << 64) - 1
+
+
+def mix(x):
+    # splitmix64 finalizer of a uint64 array, wrapping like the scalar version
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def mix_scalar(x):
+    x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94d049bb133111eb & MASK64
+    return x ^ (x >> 31)
+
+
+class DedupFilter:
+    # Bloom filter of the (src, des, port) triples seen in the current epoch, so repeats can skip the sketch
+    # holds at most capacity triples and is emptied when full, a new triple is then dropped with
+    # probability at most fp_rate
+
+    def __init__(self, capacity=1 << 20, fp_rate=0.001):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.m = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))  # bits
+        self.k = max(1, round(self.m / capacity * math.log(2)))                            # hashes per triple
+        self.bits = np.zeros((self.m + 7) // 8, dtype=np.uint8)
+        self.count = 0          # triples added since the last reset
+        self.lookups = 0
+        self.hits = 0
+        self.resets = 0         # resets forced by reaching capacity
+
+    def reset(self):
+        # forget every triple, at the start of an epoch
+        self.bits[:] = 0
+        self.count = 0
+
+    def hit_ratio(self):
+        # fraction of the triples looked up that were dropped as repeats
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def hash(self, src, des, port):
+        # 64-bit hash of each triple, the bit positions depend on nothing else
+        return mix(mix(np.asarray(port, dtype=np.uint64) + np.uint64(0x9e3779b97f4a7c15)) ^
+                   (np.asarray(src, dtype=np.uint64) << np.uint64(32) | np.asarray(des, dtype=np.uint64)))
+
+    def positions(self, h1):
+        # (len, k) bit positions of each hashed triple, by double hashing
+        h2 = mix(h1) | np.uint64(1)
+        j = np.arange(self.k, dtype=np.uint64)
+        return (h1[:, None] + j * h2[:, None]) % np.uint64(self.m)
+
+    def positions_scalar(self, src, des, port):
+        h1 = mix_scalar(mix_scalar(port + 0x9e3779b97f4a7c15 & MASK64) ^ (src << 32 | des))
+        h2 = mix_scalar(h1) | 1
+        return [(h1 + j * h2 & MASK64) % self.m for j in range(self.k)]
+
+    def seen(self, src, des, port):
+        # whether one triple was already added, adding it if not
+        self.lookups += 1
+        bits = self.bits
+        positions = self.positions_scalar(src, des, port)
+        if all(bits[x >> 3] >> (x & 7) & 1 for x in positions):
+            self.hits += 1
+            return True
+        if self.count >= self.capacity:
+            self.reset()
+            self.resets += 1
+        for x in positions:
+            bits[x >> 3] |= 1 << (x & 7)
+        self.count += 1
+        return False
+
+    def fresh(self, src, des, port):
+        # mask of the triples of a batch not added before, adding them
+        src = np.asarray(src)
+        des = np.asarray(des)
+        port = np.asarray(port)
+        mask = np.ones(len(src), dtype=bool)
+        for start in range(0, len(src), self.capacity):
+            end = min(start + self.capacity, len(src))
+            # only the first copy of a triple in the chunk can be new, later copies are repeats of it
+            h1, first = np.unique(self.hash(src[start:end], des[start:end], port[start:end]), return_index=True)
+            positions = self.positions(h1)
+            byte = (positions >> np.uint64(3)).astype(np.intp)
+            bit = (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8))
+            new = ((self.bits[byte] & bit) == 0).any(axis=1)
+            added = int(new.sum())
+            if self.count + added > self.capacity:
+                self.reset()
+                self.resets += 1
+                new[:] = True
+                added = len(h1)
+            np.bitwise_or.at(self.bits, byte[new].ravel(), bit[new].ravel())
+            self.count += added
+            mask[start:end] = False
+            mask[start + first[new]] = True
+        self.lookups += len(src)
+        self.hits += len(src) - int(mask.sum())
+        return mask
@@ -1,6 +1,86 @@
-import pandas as pd
+import numpy as np
 import os
-import datetime
+import time
+
+from stream import TraceStats, iter_batches
+
+
+def detect_anomalies(ssketch):
+    # detect super spreaders/changers/receivers of the epoch held by the sketch and attribute them
+    # Identify super rows, super changed rows and super columns
+    abrow_list_spreader, abrow_list_changer = ssketch.cal_abrow_list()
+    abcol_list_receiver = ssketch.cal_abcol_list()
+
+    # Reversibly reconstruct abnormal addresses
+    sip_list_spreader = ssketch.recon_sip(abrow_list_spreader)
+    if abrow_list_changer:
+        sip_list_changer = ssketch.recon_sip(abrow_list_changer)
+    else:
+        sip_list_changer = []
+    dip_list_receiver = ssketch.recon_dip(abcol_list_receiver)
+
+    # Anomaly attribute, addresses are sorted so the report does not depend on the Flag layout
+    sip_list_spreader = sorted(sip_list_spreader)
+    sip_list_changer = sorted(sip_list_changer)
+    dip_list_receiver = sorted(dip_list_receiver)
+    sip_list_abnormal = sorted(set(sip_list_spreader) | set(sip_list_changer))
+    return {
+        'spreaders': sip_list_spreader,
+        'changers': sip_list_changer,
+        'receivers': dip_list_receiver,
+        'sip_attribution': ssketch.anomaly_attribution_sip(sip_list_abnormal),
+        'dip_attribution': ssketch.anomaly_attribution_dip(dip_list_receiver),
+    }
+
+
+def detect_suspects(ssketch):
+    # super spreaders/changers/receivers of the epoch so far, reconstructed from the top-k rows and columns
+    # of a sketch built with top_k, without closing the epoch
+    abrow_list_spreader, abrow_list_changer, abcol_list_receiver = ssketch.current_suspects()
+    return {
+        'spreaders': ssketch.recon_sip(abrow_list_spreader),
+        'changers': ssketch.recon_sip(abrow_list_changer) if abrow_list_changer else [],
+        'receivers': ssketch.recon_dip(abcol_list_receiver),
+    }
+
+
+def evaluate_trace(ssketch, path, chunksize=1 << 16):
+    # stream a trace file into the sketch and measure its throughput and estimation errors
+    stats = TraceStats()
+
+    # Process data, streamed in chunks while the ground truth is collected in the same pass,
+    # only the sketch updates are timed, not the CSV parsing or the ground truth
+    elapsed = 0.0
+    for src, des, port in iter_batches(path, chunksize):
+        start = time.perf_counter()
+        ssketch.update_batch(src, des, port)
+        elapsed += time.perf_counter() - start
+        stats.update(src, des, port)
+
+    # ---------------calculate error-----------------
+
+    # Statistical information of subtrace
+    src_des = stats.dc()
+    src_port = stats.dpc()
+    des_src = stats.sc()
+
+    num_src = len(src_des[0])  # the number of sources in a single subtrace
+    num_des = len(des_src[0])  # the number of destinations in a single subtrace
+    evaluation = {
+        'throughput': stats.records/elapsed if elapsed else 0.0,
+        'sources': src_des[0],
+        'destinations': des_src[0],
+    }
+
+    # Average Relative Error in cardinality (ARE)
+    # Average Absolute Error in cardinality (AAE)
+    for name, (addrs, real), estimate, num in (('dc', src_des, ssketch.cal_dc_many, num_src),
+                                                ('dpc', src_port, ssketch.cal_dpc_many, num_src),
+                                                ('sc', des_src, ssketch.cal_sc_many, num_des)):
+        est = estimate(addrs)
+        evaluation['ARE_' + name] = float((np.abs(est - real) / real).sum()) / num
+        evaluation['AAE_' + name] = float(np.abs(est - real).sum()) / num
+    return evaluation
 
 
 class Experiment:
@@ -8,6 +88,8 @@ class Experiment:
     def __init__(self, file_path):
         self.file_path = file_path
         self.ssketch = None
+        self.chunksize = 1 << 16    # flows read from a trace file at a time
+        self.metrics = None         # optional metrics.Metrics, flushed after every file
         self.count = 0
         self.throughput = 0
         self.spreader_detect = []
@@ -33,125 +115,63 @@ class Experiment:
 
     def step1(self):
         files = os.listdir(self.file_path)
+        if self.metrics is not None:
+            self.ssketch.metrics = self.metrics
+            self.metrics.add_source(self.ssketch.occupancy)
         for file in files:
             self.count += 1
             print('No %d detection begins' % self.count)
             # Initialize
             self.ssketch.initialize()
             f = os.path.join(self.file_path, file)
-            df = pd.read_csv(f, usecols=['Src IP', 'Dst IP', 'Dst Port'])
-            table = df.drop_duplicates().reset_index(drop=True)
             print('Initialization finished. ')
 
-            # Process data
-            self.ssketch.process_data(table, 0, len(table))
-            print('Data processing finished. ')
-            through = len(table)/(endtime-starttime).total_seconds()
-            self.throughput += through
-
-            # ---------------calculate error-----------------
-
-            # Statistical information of subtrace
-            src_des = table.groupby('Src IP')['Dst IP'].nunique()
-            src_port = table.groupby('Src IP')['Dst Port'].nunique()
-            des_src = table.groupby('Dst IP')['Src IP'].nunique()
-
-            num_src = len(src_des.index)  # the number of sources in a single subtrace
-            num_des = len(des_src.index)  # the number of destinations in a single subtrace
-            # num_dport = table['Dst Port'].nunique()  # the number of destination ports in a single subtrace
-            self.src_list.extend(src_des.index)
-            self.des_list.extend(des_src.index)
-
-            dc_aresum = 0
-            dpc_aresum = 0
-            sc_aresum = 0
-            dc_aaesum = 0
-            dpc_aaesum = 0
-            sc_aaesum = 0
-
-            # Average Relative Error in cardinality (ARE)
-            # Average Absolute Error in cardinality (AAE)
-
-            # Calculate the ARE and AAE of dc(destination cardinality) in a single detection
-            for item in src_des.index:
-                real_dc = src_des[item]
-                est_dc = self.ssketch.cal_dc(item)
-                dc_aresum += float(abs(est_dc - real_dc)) / real_dc
-                dc_aaesum += abs(est_dc - real_dc)
-            ARE_dc = float(dc_aresum) / num_src
-            AAE_dc = float(dc_aaesum) / num_src
-            self.AREDC += ARE_dc
-            self.AAEDC += AAE_dc
-
-            # Calculate the ARE and AAE of dpc(destination port cardinality) in a single detection
-
-            self.ssketch.sc_frequency = []
-            for i in range(self.ssketch.n):
-                sci = {}
-                self.ssketch.sc_frequency.append(sci)
-                for row in self.ssketch.sketch[i]:
-                    for key in self.ssketch.sketch[i][row].keys():
-                        self.ssketch.sc_frequency[i][key] = self.ssketch.sc_frequency[i].get(key, 0) + 1
-
-            for item in src_port.index:
-                real_dpc = src_port[item]
-                est_dpc = self.ssketch.cal_dpc(item)
-                dpc_aresum += float(abs(est_dpc - real_dpc)) / real_dpc
-                dpc_aaesum += abs(est_dpc - real_dpc)
-            ARE_dpc = float(dpc_aresum) / num_src
-            AAE_dpc = float(dpc_aaesum) / num_src
-            self.AREDPC += ARE_dpc
-            self.AAEDPC += AAE_dpc
-
-            # Calculate the ARE and AAE of sc(source cardinality) in a single detection
-            for item in des_src.index:
-                real_sc = des_src[item]
-                est_sc = self.ssketch.cal_sc(item)
-                sc_aresum += float(abs(est_sc - real_sc)) / real_sc
-                sc_aaesum += abs(est_sc - real_sc)
-            ARE_sc = float(sc_aresum) / num_des
-            AAE_sc = float(sc_aaesum) / num_des
-            self.ARESC += ARE_sc
-            self.AAESC += AAE_sc
-
-            print('ARE_dc : {}'.format(ARE_dc))
-            print('ARE_dpc : {}'.format(ARE_dpc))
-            print('ARE_sc : {}'.format(ARE_sc))
-            print('AAE_dc : {}'.format(AAE_dc))
-            print('AAE_dpc : {}'.format(AAE_dpc))
-            print('AAE_sc : {}'.format(AAE_sc))
-            print('No %d detection and analysis finished. \n' % self.count)
+            evaluation = evaluate_trace(self.ssketch, f, self.chunksize)
+            self.record_evaluation(evaluation)
 
             # ---------------anomaly detection-----------------
-            # Identify super rows, super changed rows and super columns
-            abrow_list = self.ssketch.cal_abrow_list()
-            abrow_list_spreader = abrow_list[0]
-            abrow_list_changer = abrow_list[1]
-            abcol_list_receiver = self.ssketch.cal_abcol_list()
-            print('Abnormal rows/columns identification finished. ')
-
-            # Reversibly reconstruct abnormal addresses
-            sip_list_spreader = self.ssketch.recon_sip(abrow_list_spreader)
-            if abrow_list_changer:
-                sip_list_changer = self.ssketch.recon_sip(abrow_list_changer)
-            else:
-                sip_list_changer = []
-            dip_list_receiver = self.ssketch.recon_dip(abcol_list_receiver)
-            print('Reversible reconstruction finished. ')
-
-            self.spreader_detect.extend(sip_list_spreader)
-            self.changer_detect.extend(sip_list_changer)
-            self.receiver_detect.extend(dip_list_receiver)
-
-            # Anomaly attribute
-            sip_list_abnormal = list(set(sip_list_spreader) | set(sip_list_changer))
-            sip_attribution = self.ssketch.anomaly_attribution_sip(sip_list_abnormal)
-            dip_attribution = self.ssketch.anomaly_attribution_dip(dip_list_receiver)
-            print('Anomaly attribution finished. ')
-            print('Abnormal source addresses attribution: ')
-            print(sip_attribution)
-            print('Abnormal destination addresses attribution: ')
-            print(dip_attribution)
+            report = detect_anomalies(self.ssketch)
+            self.record_detection(report)
+
+    def record_evaluation(self, evaluation):
+        # accumulate and print the throughput and estimation errors of one file
+        print('Data processing finished. ')
+        self.throughput += evaluation['throughput']
+        if self.metrics is not None:
+            self.metrics.gauge('throughput', evaluation['throughput'])
+        self.src_list.extend(evaluation['sources'].tolist())
+        self.des_list.extend(evaluation['destinations'].tolist())
+        self.AREDC += evaluation['ARE_dc']
+        self.AAEDC += evaluation['AAE_dc']
+        self.AREDPC += evaluation['ARE_dpc']
+        self.AAEDPC += evaluation['AAE_dpc']
+        self.ARESC += evaluation['ARE_sc']
+        self.AAESC += evaluation['AAE_sc']
+
+        print('ARE_dc : {}'.format(evaluation['ARE_dc']))
+        print('ARE_dpc : {}'.format(evaluation['ARE_dpc']))
+        print('ARE_sc : {}'.format(evaluation['ARE_sc']))
+        print('AAE_dc : {}'.format(evaluation['AAE_dc']))
+        print('AAE_dpc : {}'.format(evaluation['AAE_dpc']))
+        print('AAE_sc : {}'.format(evaluation['AAE_sc']))
+        print('No %d detection and analysis finished. \n' % self.count)
+
+    def record_detection(self, report):
+        # accumulate and print the anomalies detected in one file
+        print('Abnormal rows/columns identification, reversible reconstruction and anomaly attribution finished. ')
+
+        self.spreader_detect.extend(report['spreaders'])
+        self.changer_detect.extend(report['changers'])
+        self.receiver_detect.extend(report['receivers'])
+
+        print('Abnormal source addresses attribution: ')
+        print(report['sip_attribution'])
+        print('Abnormal destination addresses attribution: ')
+        print(report['dip_attribution'])
+
+        if self.metrics is not None:
+            self.metrics.count('files')
+            self.metrics.flush()
 
     def step2(self):
         # Evaluate performance
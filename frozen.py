@@ -0,0 +1,273 @@
+from collections.abc import Mapping
+from itertools import chain
+
+import numpy as np
+
+from adjacency import CSRAdjacency, EdgeLog
+from metrics import instrumented
+from storage import CompactRow, HotRow, iter_bits
+from supersketch import SuperSketch
+
+
+def bits_to_words(bits_list, words):
+    # integer bitmaps to a (len, words) uint64 array
+    data = b''.join(bits.to_bytes(8 * words, 'little') for bits in bits_list)
+    return np.frombuffer(data, dtype='<u8').reshape(-1, words)
+
+
+def words_to_bits(words):
+    # one row of uint64 words to an integer bitmap
+    return int.from_bytes(np.ascontiguousarray(words, dtype='<u8').tobytes(), 'little')
+
+
+def dict_cells(rows, words):
+    # columns and (cells, words) port bitsets of {column: {port}} rows, cells in row then insertion order
+    cells = [ports for columns in rows for ports in columns.values()]
+    columns = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(cells))
+    counts = np.fromiter(map(len, cells), dtype=np.int64, count=len(cells))
+    ports = np.fromiter(chain.from_iterable(cells), dtype=np.int64, count=int(counts.sum()))
+    flat = np.zeros(len(cells) * words, dtype='<u8')
+    np.bitwise_or.at(flat, np.repeat(np.arange(len(cells)) * words, counts) + ports // 64,
+                     np.left_shift(np.uint64(1), (ports % 64).astype(np.uint64)))
+    return columns, flat.reshape(-1, words)
+
+
+def bitmap_columns(bitmap, p):
+    # set bits of an integer column bitmap, unpacked in one pass
+    bits = np.unpackbits(np.frombuffer(bitmap.to_bytes((p + 7) // 8, 'little'), dtype=np.uint8), bitorder='little')
+    return np.flatnonzero(bits).tolist()
+
+
+def compact_cells(rows, words):
+    # columns and (cells, words) port bitsets of CompactRows, their port arrays are copied as they are
+    cells = sum(map(len, rows))
+    columns = np.fromiter(chain.from_iterable(row.columns if row.bitmap is None else bitmap_columns(row.bitmap, row.p)
+                                              for row in rows), dtype=np.int64, count=cells)
+    ports = np.frombuffer(b''.join(row.ports for row in rows), dtype='<u8')
+    return columns, ports.reshape(-1, words)
+
+
+def hot_cells(rows, row_ports, words):
+    # columns of HotRows, the port union of each row stands in for the dropped port sets of its columns
+    columns = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=sum(map(len, rows)))
+    ports = np.repeat(bits_to_words(row_ports, words), [len(row) for row in rows], axis=0)
+    return columns, ports.reshape(-1, words)
+
+
+class RowTable(Mapping):
+    # read-only {row: [dci, dpci]} over sorted rows and a (rows, 2) value array
+
+    def __init__(self, rows, values):
+        self.rows = rows
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, row_dict):
+        rows = sorted(row_dict)
+        values = np.array([row_dict[row] for row in rows], dtype=float).reshape(-1, 2)
+        return cls(np.array(rows, dtype=np.uint32), values)
+
+    def lookup(self, rows):
+        # values of an array of rows, [0, 0] for rows that are absent
+        k = np.searchsorted(self.rows, rows)
+        k[k == len(self.rows)] = 0
+        found = self.rows[k] == rows if len(self.rows) else np.zeros(len(rows), dtype=bool)
+        result = np.zeros((len(rows), 2))
+        result[found] = self.values[k[found]]
+        return result
+
+    def __getitem__(self, row):
+        k = int(np.searchsorted(self.rows, row))
+        if k < len(self.rows) and self.rows[k] == row:
+            return self.values[k].tolist()
+        raise KeyError(row)
+
+    def __iter__(self):
+        return iter(self.rows.tolist())
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def pre_row_arrays(ssketch):
+    # flat arrays holding pre_row_dict, empty if there is no previous epoch
+    arrays = {}
+    if ssketch.pre_row_dict is not None:
+        for i in range(ssketch.n):
+            pre = ssketch.pre_row_dict[i]
+            if not isinstance(pre, RowTable):
+                pre = RowTable.from_dict(pre)
+            arrays['prerows%d' % i] = pre.rows
+            arrays['pre%d' % i] = pre.values
+    return arrays
+
+
+def sketch_arrays(ssketch):
+    # flat arrays holding the sketch, Flag structures, sc_frequency and pre_row_dict
+    arrays = {}
+    for i in range(ssketch.n):
+        words = (ssketch.u[i] + 63) // 64
+        sub = ssketch.sketch[i]
+        # the cells are gathered by row type in bulk, then put in (row, column) order
+        groups = {dict: [], CompactRow: [], HotRow: []}
+        for row, columns in sub.items():
+            groups[type(columns)].append(row)
+        hot = groups[HotRow]
+        parts = [dict_cells([sub[row] for row in groups[dict]], words),
+                 compact_cells([sub[row] for row in groups[CompactRow]], words),
+                 hot_cells([sub[row] for row in hot], [ssketch.row_ports[i][row] for row in hot], words)]
+        rows = np.array(groups[dict] + groups[CompactRow] + hot, dtype=np.int64)
+        counts = np.fromiter((len(sub[row]) for row in rows.tolist()), dtype=np.int64, count=len(rows))
+        cols = np.concatenate([columns for columns, ports in parts])
+        cellports = np.concatenate([ports for columns, ports in parts])
+        row_order = np.argsort(rows)
+        rank = np.empty_like(row_order)
+        rank[row_order] = np.arange(len(rows))
+        order = np.argsort(np.repeat(rank, counts) * ssketch.p[i] + cols)
+        arrays['rows%d' % i] = rows[row_order].astype(np.uint32)
+        arrays['rowports%d' % i] = bits_to_words([ssketch.row_ports[i][row] for row in rows[row_order].tolist()],
+                                                 words)
+        arrays['colptr%d' % i] = np.concatenate([[0], np.cumsum(counts[row_order])]).astype(np.int64)
+        arrays['cols%d' % i] = cols[order].astype(np.uint32)
+        arrays['cellports%d' % i] = cellports[order]
+        sc_cols = sorted(ssketch.sc_frequency[i])
+        arrays['sccols%d' % i] = np.array(sc_cols, dtype=np.uint32)
+        arrays['scfreq%d' % i] = np.array([ssketch.sc_frequency[i][col] for col in sc_cols], dtype=np.uint32)
+    arrays.update(pre_row_arrays(ssketch))
+    for x in range(ssketch.n - 1):
+        for name, flag in (('frow', ssketch.Flag_row[x]), ('fcol', ssketch.Flag_column[x])):
+            if isinstance(flag, EdgeLog):
+                flag = flag.csr()
+            elif not isinstance(flag, CSRAdjacency):
+                flag = CSRAdjacency.from_dict(flag)
+            arrays['%skeys%d' % (name, x)] = flag.keys_array
+            arrays['%sptr%d' % (name, x)] = flag.ptr
+            arrays['%svals%d' % (name, x)] = flag.values
+    return arrays
+
+
+class FrozenSketch(SuperSketch):
+    # read-only SuperSketch over flat arrays, built by freeze() or loaded from a snapshot
+
+    def __init__(self, n, p, u, arrays, dt=0.003, ct=0.002, max_candidates=None):
+        super().__init__(n, p, u, storage='frozen', max_candidates=max_candidates)
+        self.dt = dt
+        self.ct = ct
+        self.arrays = arrays
+        self.Flag_row = [CSRAdjacency(arrays['frowkeys%d' % x], arrays['frowptr%d' % x], arrays['frowvals%d' % x])
+                         for x in range(n - 1)]
+        self.Flag_column = [CSRAdjacency(arrays['fcolkeys%d' % x], arrays['fcolptr%d' % x],
+                                         arrays['fcolvals%d' % x]) for x in range(n - 1)]
+        if 'prerows0' in arrays:
+            self.pre_row_dict = [RowTable(arrays['prerows%d' % i], arrays['pre%d' % i]) for i in range(n)]
+
+    def update(self, source, destination, port):
+        raise TypeError('a frozen sketch is read-only')
+
+    def update_batch(self, src, des, port):
+        raise TypeError('a frozen sketch is read-only')
+
+    def cal_abrow_list(self):
+        # changers are always measured against the stored previous estimates: the estimates of this epoch
+        # are not kept as pre_row_dict, so detection gives the same report however often it runs on a replica,
+        # and each detection starts with the full candidate budget of the epoch
+        self.reconstructor.reset()
+        pre_row_dict = self.pre_row_dict
+        try:
+            return super().cal_abrow_list()
+        finally:
+            self.pre_row_dict = pre_row_dict
+
+    @instrumented('recon_sip')
+    def recon_sip(self, abrow_list):
+        # the Flag structures are CSRAdjacency already: take the vectorized path, not the Mapping walk
+        return self.reconstructor.reconstruct_csr(abrow_list, self.Flag_row)
+
+    @instrumented('recon_dip')
+    def recon_dip(self, abcol_list):
+        return self.reconstructor.reconstruct_csr(abcol_list, self.Flag_column)
+
+    def row_index(self, i, row):
+        # position of the row in SSi, -1 if absent
+        rows = self.arrays['rows%d' % i]
+        k = int(np.searchsorted(rows, row))
+        if k < len(rows) and rows[k] == row:
+            return k
+        return -1
+
+    def row_arrays(self, i):
+        colptr = self.arrays['colptr%d' % i]
+        nports = np.bitwise_count(self.arrays['rowports%d' % i]).sum(axis=1, dtype=np.int64)
+        return self.arrays['rows%d' % i].astype(np.int64), np.diff(colptr), nports
+
+    def col_arrays(self, i):
+        return self.arrays['sccols%d' % i].astype(np.int64), self.arrays['scfreq%d' % i].astype(np.int64)
+
+    def cal_dci(self, i, row):
+        k = self.row_index(i, row)
+        if k < 0:
+            return 0
+        colptr = self.arrays['colptr%d' % i]
+        return self.dc_table[i][int(colptr[k + 1] - colptr[k])]
+
+    def cal_dpci(self, i, row):
+        k = self.row_index(i, row)
+        if k < 0:
+            return 0
+        return self.dpc_table[i][int(np.bitwise_count(self.arrays['rowports%d' % i][k]).sum())]
+
+    def cal_sci(self, i, column):
+        cols = self.arrays['sccols%d' % i]
+        k = int(np.searchsorted(cols, column))
+        if k < len(cols) and cols[k] == column:
+            return self.dc_table[i][int(self.arrays['scfreq%d' % i][k])]
+        return 0
+
+    def occupancy(self):
+        gauges = {}
+        for i in range(self.n):
+            columns = np.diff(self.arrays['colptr%d' % i])
+            gauges['rows%d' % i] = len(columns)
+            gauges['cells%d' % i] = int(columns.sum())
+            gauges['max_columns%d' % i] = int(columns.max(initial=0))
+            gauges['sc_columns%d' % i] = len(self.arrays['sccols%d' % i])
+        gauges['flag_edges'] = sum(len(flag.values) for flag in self.Flag_row + self.Flag_column)
+        gauges['recon_explored'] = self.reconstructor.explored
+        gauges['recon_pruned'] = self.reconstructor.pruned
+        gauges['recon_truncated'] = self.reconstructor.truncated
+        gauges['memory_bytes'] = self.memory_usage()
+        return gauges
+
+    def memory_usage(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def thaw(self):
+        # rebuild a writable SuperSketch holding the same state
+        ssketch = SuperSketch(self.n, self.p, self.u)
+        ssketch.dt = self.dt
+        ssketch.ct = self.ct
+        ssketch.initialize()
+        for i in range(self.n):
+            rows = self.arrays['rows%d' % i].tolist()
+            colptr = self.arrays['colptr%d' % i].tolist()
+            cols = self.arrays['cols%d' % i].tolist()
+            cellports = self.arrays['cellports%d' % i]
+            rowports = self.arrays['rowports%d' % i]
+            for k, row in enumerate(rows):
+                ssketch.sketch[i][row] = {cols[c]: set(iter_bits(words_to_bits(cellports[c])))
+                                          for c in range(colptr[k], colptr[k + 1])}
+                ssketch.row_ports[i][row] = words_to_bits(rowports[k])
+            ssketch.sc_frequency[i] = dict(zip(self.arrays['sccols%d' % i].tolist(),
+                                               self.arrays['scfreq%d' % i].tolist()))
+        for x in range(self.n - 1):
+            ssketch.Flag_row[x] = {key: set(self.Flag_row[x][key]) for key in self.Flag_row[x]}
+            ssketch.Flag_column[x] = {key: set(self.Flag_column[x][key]) for key in self.Flag_column[x]}
+        if self.pre_row_dict is not None:
+            ssketch.pre_row_dict = [dict(zip(pre.rows.tolist(), pre.values.tolist())) for pre in self.pre_row_dict]
+        return ssketch
+
+
+def freeze(ssketch):
+    # read-only array view of the current state of a sketch
+    return FrozenSketch(ssketch.n, ssketch.p, ssketch.u, sketch_arrays(ssketch), ssketch.dt, ssketch.ct,
+                        ssketch.reconstructor.max_candidates)
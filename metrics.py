@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+import functools
+import json
+import time
+
+
+class JsonLinesSink:
+    # write each metrics record as one JSON line to a path or an open file
+
+    def __init__(self, target):
+        self.file = open(target, 'a') if isinstance(target, str) else target
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+
+class Metrics:
+    # counters, timers and gauges, handed to a sink (any callable taking a dict) on flush
+    # and every interval seconds if interval is set
+
+    def __init__(self, sink=None, interval=None):
+        self.sink = sink
+        self.interval = interval
+        self.counters = {}
+        self.timers = {}    # name: [calls, total seconds, max seconds]
+        self.gauges = {}
+        self.sources = []   # callables returning gauges, polled on flush
+        self.last_flush = time.monotonic()
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+        if self.interval is not None and time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def merge(self, timers, counters):
+        # add raw timers ({name: [calls, total, max]}) and counters recorded elsewhere, e.g. in a worker process
+        for name, (calls, total, longest) in timers.items():
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += calls
+            timer[1] += total
+            timer[2] = max(timer[2], longest)
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def add_source(self, source):
+        # register a callable returning {name: value} gauges, e.g. SuperSketch.occupancy
+        self.sources.append(source)
+
+    def snapshot(self):
+        for source in self.sources:
+            self.gauges.update(source())
+        return {
+            'time': time.time(),
+            'counters': dict(self.counters),
+            'timers': {name: {'calls': calls, 'seconds': total, 'max': longest}
+                       for name, (calls, total, longest) in self.timers.items()},
+            'gauges': dict(self.gauges),
+        }
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        record = self.snapshot()
+        if self.sink is not None:
+            self.sink(record)
+        return record
+
+
+def instrumented(name):
+    # time a SuperSketch method into self.metrics when metrics are enabled
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
+
+import numpy as np
+
+from codec import addrs2dec
+from detect import Experiment, detect_anomalies, evaluate_trace
+from frozen import RowTable
+from metrics import Metrics
+import snapshot
+
+
+def build_shard(template, src, des, port):
+    # build a sketch over one chunk of flows, template is an empty sketch from SuperSketch.spawn
+    template.update_batch(src, des, port)
+    return template
+
+
+def parallel_ingest(ssketch, src, des, port, workers=None, chunks=None):
+    # split the flows into chunks, build a shard per chunk in a process pool and merge the shards into ssketch
+    workers = workers or os.cpu_count()
+    chunks = chunks or workers
+    src = addrs2dec(src)
+    des = addrs2dec(des)
+    port = np.asarray(port)
+    parts = [np.array_split(x, chunks) for x in (src, des, port)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        template = ssketch.spawn()
+        futures = [executor.submit(build_shard, template, parts[0][k], parts[1][k], parts[2][k])
+                   for k in range(chunks)]
+        for future in futures:
+            ssketch.merge(future.result())
+    return ssketch
+
+
+def parallel_process_data(ssketch, table, workers=None, chunks=None):
+    # process the flows of a table with parallel_ingest
+    return parallel_ingest(ssketch, table['Src IP'].to_numpy(), table['Dst IP'].to_numpy(),
+                           table['Dst Port'].to_numpy(dtype=np.uint16), workers, chunks)
+
+
+def row_tables(ssketch):
+    # [dci, dpci] estimates of every row, the pre_row_dict the next epoch compares against
+    tables = []
+    for i in range(ssketch.n):
+        rows, ncols, nports = ssketch.row_arrays(i)
+        order = np.argsort(rows)
+        values = np.column_stack((ssketch.dc_array[i][ncols], ssketch.dpc_array[i][nports]))
+        tables.append(RowTable(rows[order].astype(np.uint32), values[order]))
+    return tables
+
+
+def recorded(ssketch, prefix=''):
+    # timers, counters and the occupancy gauges starting with prefix a worker's sketch recorded,
+    # for the metrics of the parent
+    gauges = {name: value for name, value in ssketch.occupancy().items() if name.startswith(prefix)}
+    return ssketch.metrics.timers, ssketch.metrics.counters, gauges
+
+
+def evaluate_file(ssketch, path, chunksize, snapshot_path, timed=False):
+    # worker: build and evaluate the sketch of one trace file, ssketch is an empty sketch from SuperSketch.spawn,
+    # and save it for detection, with what it recorded if timed
+    ssketch.metrics = Metrics() if timed else None
+    evaluation = evaluate_trace(ssketch, path, chunksize)
+    snapshot.save(ssketch, snapshot_path)
+    evaluation['rows'] = row_tables(ssketch)
+    if timed:
+        evaluation['recorded'] = recorded(ssketch)
+    return evaluation
+
+
+def detect_file(snapshot_path, pre_row_dict, timed=False):
+    # worker: detect the anomalies of a saved sketch against the row estimates of the previous file,
+    # with what it recorded if timed
+    ssketch = snapshot.load(snapshot_path)
+    ssketch.pre_row_dict = pre_row_dict
+    ssketch.metrics = Metrics() if timed else None
+    report = detect_anomalies(ssketch)
+    if timed:
+        # the other gauges describe the saved arrays, not the sketch that was built
+        report['recorded'] = recorded(ssketch, 'recon_')
+    return report
+
+
+class ParallelExperiment(Experiment):
+    # Experiment whose trace files are ingested, evaluated and analyzed in a process pool,
+    # only the row estimates of each file are passed on for the changer detection of the next one,
+    # the timers, counters and occupancy the workers record are merged into self.metrics file by file
+
+    def __init__(self, file_path, workers=None):
+        super().__init__(file_path)
+        self.workers = workers or os.cpu_count()
+
+    def step1(self):
+        files = os.listdir(self.file_path)
+        ssketch = self.ssketch
+        with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(max_workers=self.workers) as executor:
+            paths = [os.path.join(directory, '%d.sketch' % k) for k in range(len(files))]
+            template = ssketch.spawn()
+            timed = self.metrics is not None
+            evaluations = [executor.submit(evaluate_file, template, os.path.join(self.file_path, file),
+                                           self.chunksize, path, timed)
+                           for file, path in zip(files, paths)]
+            # detection of a file starts as soon as it and the file before it are evaluated
+            reports = []
+            pre_row_dict = ssketch.pre_row_dict
+            for evaluation, path in zip(evaluations, paths):
+                rows = evaluation.result()['rows']
+                reports.append(executor.submit(detect_file, path, pre_row_dict, timed))
+                pre_row_dict = rows
+            ssketch.pre_row_dict = pre_row_dict
+
+            for evaluation, report in zip(evaluations, reports):
+                self.count += 1
+                print('No %d detection begins' % self.count)
+                print('Initialization finished. ')
+                evaluation = evaluation.result()
+                report = report.result()
+                self.record_metrics(evaluation, report)
+                self.record_evaluation(evaluation)
+                self.record_detection(report)
+
+    def record_metrics(self, *results):
+        # merge what the workers recorded for one file into self.metrics
+        for result in results:
+            if 'recorded' in result:
+                timers, counters, gauges = result.pop('recorded')
+                self.metrics.merge(timers, counters)
+                self.metrics.gauges.update(gauges)
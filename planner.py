@@ -0,0 +1,157 @@
+import math
+import time
+
+import numpy as np
+
+from recon import IPV4_LIMIT
+from stream import TraceStats
+from supersketch import SuperSketch
+
+# memory_usage() bytes per occupied cell, per 64-bit word of its port bitset and per occupied row of a
+# sub-sketch, per storage
+CELL_BYTES = {'dict': 308.0, 'compact': 2.0}
+CELL_WORD_BYTES = {'dict': 0.0, 'compact': 8.4}
+ROW_BYTES = {'dict': 198.0, 'compact': 359.0}
+# row_ports bytes per occupied row besides its u-bit port union, sc_frequency bytes per occupied column
+ROW_PORT_BYTES = 70.0
+COLUMN_BYTES = 98.0
+# bytes per Flag key and per Flag edge, per Flag mode
+KEY_BYTES = {'sets': 211.0, 'log': 0.0}
+EDGE_BYTES = {'sets': 82.0, 'log': 8.0}
+# update_batch seconds per flow and per distinct cell inserted, per sub-sketch, and per distinct Flag edge
+FLOW_SECONDS = 2.5e-7
+CELL_SECONDS = {'dict': 1.7e-6, 'compact': 2.0e-6}
+EDGE_SECONDS = {'sets': 2.5e-6, 'log': 0.0}
+
+
+def is_prime(x):
+    if x < 2:
+        return False
+    for d in range(2, math.isqrt(x) + 1):
+        if x % d == 0:
+            return False
+    return True
+
+
+def primes_from(start, count):
+    # the count smallest primes >= start, distinct primes are pairwise coprime
+    primes = []
+    x = max(2, start)
+    while len(primes) < count:
+        if is_prime(x):
+            primes.append(x)
+        x += 1
+    return primes
+
+
+def validate(p, u):
+    # raise ValueError unless p and u are pairwise coprime and the product of p covers every IPv4 address
+    for moduli in (p, u):
+        for i in range(len(moduli)):
+            for j in range(i + 1, len(moduli)):
+                if math.gcd(moduli[i], moduli[j]) != 1:
+                    raise ValueError('%d and %d are not coprime' % (moduli[i], moduli[j]))
+    if math.prod(p) < IPV4_LIMIT:
+        raise ValueError('the product of p is %d, the CRT reconstruction needs at least %d' % (math.prod(p), IPV4_LIMIT))
+
+
+def occupied(m, k):
+    # expected number of occupied buckets out of m after k distinct keys
+    return m * -math.expm1(-k / m)
+
+
+def lc_error(k, m):
+    # relative standard error of the linear counting estimate of k distinct items in m buckets
+    t = k / m
+    return math.sqrt(m * (math.exp(t) - t - 1)) / k
+
+
+def collision_error(hosts, p, n):
+    # expected relative error of dc/sc from other hosts sharing the row/column in all n sub-sketches
+    return (-math.expm1(-hosts / p)) ** n
+
+
+def predict(n, p, u, flows, sources, destinations=None, records=None, storage='dict', flags='sets'):
+    # predicted memory_usage(), update_batch seconds and ARE of dc/sc for an epoch of flows distinct
+    # (src, des) pairs between the given numbers of sources and destinations, records flows in total
+    destinations = destinations or sources
+    records = records or flows
+    memory = 0.0
+    seconds = 0.0
+    for i in range(n):
+        cells = occupied(p[i] * p[i], flows)
+        rows = occupied(p[i], sources)
+        memory += cells * (CELL_BYTES[storage] + CELL_WORD_BYTES[storage] * ((u[i] + 63) // 64))
+        memory += rows * (ROW_BYTES[storage] + ROW_PORT_BYTES + u[i] / 8)
+        memory += occupied(p[i], destinations) * COLUMN_BYTES
+        seconds += cells * CELL_SECONDS[storage] + records * FLOW_SECONDS
+    for x in range(n - 1):
+        keys = occupied(p[x], sources) + occupied(p[x], destinations)
+        edges = occupied(p[x] * p[x + 1], sources) + occupied(p[x] * p[x + 1], destinations)
+        memory += keys * KEY_BYTES[flags] + edges * EDGE_BYTES[flags]
+        seconds += edges * EDGE_SECONDS[flags]
+    return {
+        'memory': memory,
+        'update_seconds': seconds,
+        'throughput': records / seconds,
+        'are_dc': collision_error(sources, min(p), n),
+        'are_sc': collision_error(destinations, min(p), n),
+    }
+
+
+def candidates(flows, sources, destinations=None, records=None, accuracy=0.01, max_ports=2000,
+               port_accuracy=0.1, storage='dict', flags='sets', n_choices=range(3, 8), max_p=1 << 20):
+    # one configuration per n: the smallest coprime p that cover the IPv4 space with the CRT and reach the
+    # accuracy, and the smallest u that estimate max_ports destination ports within port_accuracy
+    destinations = destinations or sources
+    hosts = max(sources, destinations)
+    u_min = max(2, math.ceil(max_ports / 16))
+    while lc_error(max_ports, u_min) > port_accuracy:
+        u_min = math.ceil(u_min * 1.1)
+    for n in n_choices:
+        p_crt = math.ceil(IPV4_LIMIT ** (1 / n))
+        p_accuracy = math.ceil(-hosts / math.log1p(-accuracy ** (1 / n)))
+        p = primes_from(max(p_crt, p_accuracy), n)
+        if p[-1] > max_p:
+            continue
+        u = primes_from(u_min, n)
+        validate(p, u)
+        config = {'n': n, 'p': p, 'u': u, 'storage': storage, 'flags': flags}
+        config.update(predict(n, p, u, flows, sources, destinations, records, storage, flags))
+        yield config
+
+
+def plan(flows, sources, destinations=None, records=None, memory=None, accuracy=0.01, max_ports=2000,
+         port_accuracy=0.1, storage='dict', flags='sets', n_choices=range(3, 8), max_p=1 << 20):
+    # the configuration with the lowest predicted memory that meets the accuracy and fits in memory bytes
+    configs = sorted(candidates(flows, sources, destinations, records, accuracy, max_ports, port_accuracy,
+                                storage, flags, n_choices, max_p), key=lambda config: config['memory'])
+    if not configs:
+        raise ValueError('no n in %s reaches accuracy %g with p <= %d' % (list(n_choices), accuracy, max_p))
+    if memory is not None and configs[0]['memory'] > memory:
+        raise ValueError('the smallest configuration needs %.0f bytes, more than %d' % (configs[0]['memory'], memory))
+    return configs[0]
+
+
+def calibrate(config, src, des, port):
+    # compare the predictions for a sample trace with a run of the configuration over it
+    stats = TraceStats()
+    stats.update(src, des, port)
+    sources, dc = stats.dc()
+    destinations, sc = stats.sc()
+    predicted = predict(config['n'], config['p'], config['u'], int(dc.sum()), len(sources), len(destinations),
+                        stats.records, config['storage'], config['flags'])
+
+    ssketch = SuperSketch(config['n'], config['p'], config['u'], config['storage'], flags=config['flags'])
+    ssketch.initialize()
+    start = time.perf_counter()
+    ssketch.update_batch(src, des, port)
+    seconds = time.perf_counter() - start
+    measured = {
+        'memory': ssketch.memory_usage(),
+        'update_seconds': seconds,
+        'throughput': stats.records / seconds,
+        'are_dc': float((np.abs(ssketch.cal_dc_many(sources) - dc) / dc).mean()),
+        'are_sc': float((np.abs(ssketch.cal_sc_many(destinations) - sc) / sc).mean()),
+    }
+    return {key: (predicted[key], measured[key]) for key in measured}
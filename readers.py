@@ -0,0 +1,266 @@
+import struct
+
+import numpy as np
+
+# pcap magic numbers as read little-endian: (header byte order, nanosecond timestamps)
+PCAP_MAGIC = {
+    0xa1b2c3d4: ('<', False),
+    0xd4c3b2a1: ('>', False),
+    0xa1b23c4d: ('<', True),
+    0x4d3cb2a1: ('>', True),
+}
+# offset of the IPv4 header after the link-layer header, per pcap link type
+LINK_OFFSETS = {
+    0: 4,       # BSD loopback
+    1: 14,      # Ethernet, VLAN tags are handled per packet
+    101: 0,     # raw IP
+    113: 16,    # Linux cooked capture
+    228: 0,     # raw IPv4
+}
+PCAP_HEADER = 24
+PCAP_RECORD = 16
+NETFLOW5_HEADER = 24
+NETFLOW5_RECORD = 48
+NETFLOW5_MAX = 30       # records per export datagram
+RUN_STREAK = 8          # packets in a row of the same captured length before a run of them is read in bulk
+RUN_WINDOW = 64         # packets checked by the first bulk read of a run, doubled while the run goes on
+
+
+def be16(data, pos):
+    # big-endian uint16 at every position of an array of offsets
+    return data[pos].astype(np.int64) << 8 | data[pos + 1]
+
+
+def be32(data, pos):
+    # big-endian uint32 at every position of an array of offsets
+    return (data[pos].astype(np.int64) << 24 | data[pos + 1].astype(np.int64) << 16 |
+            data[pos + 2].astype(np.int64) << 8 | data[pos + 3])
+
+
+def trace_format(path):
+    # 'pcap', 'netflow5' or 'csv', from the first bytes of the file
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if len(head) == 4 and struct.unpack('<I', head)[0] in PCAP_MAGIC:
+        return 'pcap'
+    if head[:2] == b'\x00\x05':
+        return 'netflow5'
+    return 'csv'
+
+
+def pcap_records(data, start, chunksize, order, resolution=1e-6):
+    # offsets, captured lengths and timestamps of up to chunksize packets from start, and the next offset
+    # each offset depends on the captured length before it, so packets are walked one at a time, except in runs
+    # of packets of the same length (fixed-size or snaplen-cut captures), whose offsets are checked in bulk
+    unpack = struct.Struct(order + 'I').unpack_from
+    lengths = np.dtype(order + 'u4')
+    offsets = np.empty(chunksize, dtype=np.int64)
+    end = len(data)
+    count = 0
+    last = None
+    streak = 0
+    window = RUN_WINDOW
+    while count < chunksize and start + PCAP_RECORD <= end:
+        caplen = unpack(data, start + 8)[0]
+        stride = PCAP_RECORD + caplen
+        if start + stride > end:
+            # truncated packet
+            start = end
+            break
+        if caplen != last:
+            last = caplen
+            streak = 1
+        elif streak < RUN_STREAK:
+            streak += 1
+        else:
+            # the run goes on up to the first packet of another length
+            room = min(chunksize - count, (end - start) // stride, window)
+            run = start + stride * np.arange(room)
+            same = data[run[:, None] + np.arange(8, 12)].view(lengths)[:, 0] == caplen
+            size = room if same.all() else int(np.argmin(same))
+            window = window * 2 if size == room else RUN_WINDOW
+            offsets[count:count + size] = run[:size]
+            count += size
+            start += stride * size
+            continue
+        offsets[count] = start
+        count += 1
+        start += stride
+    offsets = offsets[:count]
+    header = data[offsets[:, None] + np.arange(PCAP_RECORD)].view(order + 'u4')
+    return offsets, header[:, 2].astype(np.int64), header[:, 0] + header[:, 1] * resolution, start
+
+
+def parse_packets(data, offsets, caplen, linktype):
+    # (src, des, port, mask) of IPv4 packets starting at offsets, mask marks the ones that were parsed
+    # the port is 0 for packets that are neither TCP nor UDP and for IPv4 fragments other than the first,
+    # which carry no transport header
+    ip = offsets + LINK_OFFSETS[linktype]
+    valid = caplen >= LINK_OFFSETS[linktype] + 20
+    if linktype == 1:
+        ethertype = be16(data, np.where(valid, offsets + 12, 0))
+        vlan = ethertype == 0x8100
+        ip = np.where(vlan, ip + 4, ip)
+        ethertype = np.where(vlan, be16(data, np.where(valid, offsets + 16, 0)), ethertype)
+        valid &= ethertype == 0x0800
+    elif linktype == 113:
+        valid &= be16(data, np.where(valid, offsets + 14, 0)) == 0x0800
+    end = offsets + caplen
+    valid &= ip + 20 <= end
+    ip = np.where(valid, ip, 0)
+    version = data[ip] >> 4
+    valid &= version == 4
+    ihl = (data[ip] & 0xF).astype(np.int64) * 4
+    protocol = data[ip + 9]
+    first_fragment = be16(data, ip + 6) & 0x1FFF == 0
+    src = be32(data, ip + 12)
+    des = be32(data, ip + 16)
+    transport = ip + ihl
+    has_port = valid & first_fragment & ((protocol == 6) | (protocol == 17)) & (transport + 4 <= end)
+    port = np.where(has_port, be16(data, np.where(has_port, transport + 2, 0)), 0)
+    return src, des, port, valid
+
+
+def iter_pcap(path, chunksize=1 << 16, timestamps=False):
+    # (src, des, port[, timestamps]) integer arrays of the IPv4 packets of a pcap file, chunksize packets at a time
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    magic = int(data[:4].view('<u4')[0])
+    if magic not in PCAP_MAGIC:
+        raise ValueError('%s is not a pcap file' % path)
+    order, nanoseconds = PCAP_MAGIC[magic]
+    linktype = int(data[20:24].view(order + 'u4')[0]) & 0xFFFF
+    if linktype not in LINK_OFFSETS:
+        raise ValueError('unsupported pcap link type %d' % linktype)
+    start = PCAP_HEADER
+    while start < len(data):
+        offsets, caplen, times, start = pcap_records(data, start, chunksize, order, 1e-9 if nanoseconds else 1e-6)
+        if not len(offsets):
+            break
+        src, des, port, valid = parse_packets(data, offsets + PCAP_RECORD, caplen, linktype)
+        batch = (src[valid], des[valid], port[valid])
+        yield batch + (times[valid],) if timestamps else batch
+
+
+def netflow5_records(data, start=0, chunksize=None):
+    # offsets of the flow records of the NetFlow v5 datagrams from start and of the datagram holding each one,
+    # stopping after chunksize records, and the offset of the next datagram
+    header = struct.Struct('>HH')
+    datagrams = []
+    counts = []
+    records = 0
+    while start + NETFLOW5_HEADER <= len(data) and (chunksize is None or records < chunksize):
+        version, count = header.unpack_from(data, start)
+        if version != 5:
+            raise ValueError('not a NetFlow v5 datagram at offset %d' % start)
+        if start + NETFLOW5_HEADER + NETFLOW5_RECORD * count > len(data):
+            # truncated datagram
+            start = len(data)
+            break
+        datagrams.append(start)
+        counts.append(count)
+        records += count
+        start += NETFLOW5_HEADER + NETFLOW5_RECORD * count
+    datagrams = np.array(datagrams, dtype=np.int64)
+    counts = np.array(counts, dtype=np.int64)
+    index = np.arange(records) - np.repeat(np.cumsum(counts) - counts, counts)
+    datagrams = np.repeat(datagrams, counts)
+    return datagrams + NETFLOW5_HEADER + NETFLOW5_RECORD * index, datagrams, start
+
+
+def parse_netflow5(data, offsets, datagrams, timestamps=False):
+    # (src, des, port[, timestamps]) integer arrays of the flow records at offsets
+    batch = (be32(data, offsets), be32(data, offsets + 4), be16(data, offsets + 34))
+    if not timestamps:
+        return batch
+    # flow start: export time minus the time between the first packet and the export, in router uptime
+    uptime = be32(data, datagrams + 4)
+    seconds = be32(data, datagrams + 8) + be32(data, datagrams + 12) * 1e-9
+    return batch + (seconds - (uptime - be32(data, offsets + 24)) * 1e-3,)
+
+
+def decode_netflow5(datagram, timestamps=False):
+    # (src, des, port[, timestamps]) integer arrays of one or more NetFlow v5 datagrams held in bytes
+    data = np.frombuffer(datagram, dtype=np.uint8)
+    offsets, datagrams, _ = netflow5_records(data)
+    return parse_netflow5(data, offsets, datagrams, timestamps)
+
+
+def iter_netflow5(path, chunksize=1 << 16, timestamps=False):
+    # (src, des, port[, timestamps]) integer arrays of a file of NetFlow v5 export datagrams,
+    # about chunksize records at a time
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    start = 0
+    while start < len(data):
+        offsets, datagrams, start = netflow5_records(data, start, chunksize)
+        if not len(offsets):
+            break
+        yield parse_netflow5(data, offsets, datagrams, timestamps)
+
+
+def encode_pcap(src, des, port, timestamps=None, protocol=17):
+    # pcap file contents with one Ethernet/IPv4 packet per flow, TCP (6) or UDP (17) to port
+    count = len(src)
+    if timestamps is None:
+        timestamps = np.zeros(count)
+    transport = 20 if protocol == 6 else 8
+    size = 14 + 20 + transport
+    packets = np.zeros((count, PCAP_RECORD + size), dtype=np.uint8)
+    seconds = np.floor(timestamps)
+    header = packets[:, :PCAP_RECORD].view('<u4')
+    header[:, 0] = seconds
+    header[:, 1] = np.round((timestamps - seconds) * 1e6)
+    header[:, 2] = size
+    header[:, 3] = size
+    frame = packets[:, PCAP_RECORD:]
+    frame[:, 12:14] = (8, 0)                                      # IPv4 ethertype
+    frame[:, 14] = 0x45                                           # version 4, 20-byte header
+    frame[:, 16:18] = np.array([(20 + transport) >> 8, (20 + transport) & 0xFF], dtype=np.uint8)
+    frame[:, 22] = 64                                             # TTL
+    frame[:, 23] = protocol
+    frame[:, 26:30] = np.asarray(src, dtype='>u4').view(np.uint8).reshape(-1, 4)
+    frame[:, 30:34] = np.asarray(des, dtype='>u4').view(np.uint8).reshape(-1, 4)
+    frame[:, 34:36] = np.full(count, 40000, dtype='>u2').view(np.uint8).reshape(-1, 2)
+    frame[:, 36:38] = np.asarray(port, dtype='>u2').view(np.uint8).reshape(-1, 2)
+    if protocol == 6:
+        frame[:, 46] = 0x50                                       # 20-byte TCP header
+    else:
+        frame[:, 38:40] = (0, 8)                                  # UDP length
+    magic = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+    return magic + packets.tobytes()
+
+
+def encode_netflow5(src, des, port, timestamps=None, sequence=0, uptime=1000):
+    # list of NetFlow v5 export datagrams with one record per flow, up to 30 per datagram
+    # timestamps (seconds) become the export time of each datagram, taken from its first flow
+    count = len(src)
+    if timestamps is None:
+        timestamps = np.zeros(count)
+    records = np.zeros((count, NETFLOW5_RECORD), dtype=np.uint8)
+    records[:, 0:4] = np.asarray(src, dtype='>u4').view(np.uint8).reshape(-1, 4)
+    records[:, 4:8] = np.asarray(des, dtype='>u4').view(np.uint8).reshape(-1, 4)
+    records[:, 16:20] = np.ones(count, dtype='>u4').view(np.uint8).reshape(-1, 4)       # packets
+    records[:, 24:28] = np.full(count, uptime, dtype='>u4').view(np.uint8).reshape(-1, 4)  # first
+    records[:, 28:32] = np.full(count, uptime, dtype='>u4').view(np.uint8).reshape(-1, 4)  # last
+    records[:, 34:36] = np.asarray(port, dtype='>u2').view(np.uint8).reshape(-1, 2)
+    records[:, 38] = 17
+    datagrams = []
+    for start in range(0, count, NETFLOW5_MAX):
+        chunk = records[start:start + NETFLOW5_MAX]
+        seconds = float(timestamps[start])
+        header = struct.pack('>HHIIIIBBH', 5, len(chunk), uptime, int(seconds),
+                             int(round((seconds - int(seconds)) * 1e9)) % 1000000000, sequence, 0, 0, 0)
+        datagrams.append(header + chunk.tobytes())
+        sequence += len(chunk)
+    return datagrams
+
+
+def write_pcap(path, src, des, port, timestamps=None, protocol=17):
+    # write a sample pcap file of the flows
+    with open(path, 'wb') as f:
+        f.write(encode_pcap(src, des, port, timestamps, protocol))
+
+
+def write_netflow5(path, src, des, port, timestamps=None):
+    # write a sample file of NetFlow v5 export datagrams of the flows
+    with open(path, 'wb') as f:
+        f.write(b''.join(encode_netflow5(src, des, port, timestamps)))
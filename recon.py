@@ -0,0 +1,119 @@
+import numpy as np
+
+from codec import dec2addr, decs2addr
+
+IPV4_LIMIT = 1 << 32
+
+
+class CRTBasis:
+    # mixed-radix (Garner) form of the CRT for a fixed list of coprime moduli, computed once
+
+    def __init__(self, mod_list):
+        self.mod_list = list(mod_list)
+        self.prefix = [1]   # prefix[k] = mod_list[0] * ... * mod_list[k-1]
+        for m in self.mod_list:
+            self.prefix.append(self.prefix[-1] * m)
+        self.inverse = [pow(self.prefix[k] % m, -1, m) for k, m in enumerate(self.mod_list)]
+
+    def extend(self, x, k, remainder):
+        # the smallest value congruent to x modulo prefix[k] and to remainder modulo mod_list[k]
+        return x + self.prefix[k] * ((remainder - x) * self.inverse[k] % self.mod_list[k])
+
+    def solve(self, remainder_list):
+        # the value below prod(mod_list) with the given remainders
+        x = 0
+        for k, remainder in enumerate(remainder_list):
+            x = self.extend(x, k, remainder)
+        return x
+
+
+class Reconstructor:
+    # iterative reconstruction of abnormal addresses from abnormal rows/columns and Flag edges
+
+    def __init__(self, mod_list, max_candidates=None, limit=IPV4_LIMIT):
+        self.basis = CRTBasis(mod_list)
+        self.max_candidates = max_candidates    # cap on the partial candidates kept per epoch, over all calls
+        self.limit = limit                      # candidates at or above limit are rejected
+        self.reset()
+
+    def reset(self):
+        # zero the counters of explored, pruned and truncated candidates and the candidate budget, kept per epoch
+        self.explored = 0
+        self.pruned = 0
+        self.truncated = 0
+        self.kept = 0
+
+    def cap(self, size):
+        # how many of size new partial candidates the epoch budget still allows, counting the truncated ones
+        if self.max_candidates is None:
+            return size
+        keep = max(0, min(size, self.max_candidates - self.kept))
+        self.kept += keep
+        self.truncated += size - keep
+        return keep
+
+    def reconstruct(self, ab_list, flags):
+        # addresses whose residues are abnormal in every sub-sketch and linked by Flag edges level to level
+        p = self.basis.mod_list
+        prefix = self.basis.prefix
+        ab_sets = [set(ab) for ab in ab_list]
+        # candidates are (partial CRT value, residue at the current level), in the same order as
+        # reconstruct_csr, so max_candidates keeps the same ones whatever the Flag layout
+        frontier = [(r, r) for r in sorted(ab_list[0])]
+        for level in range(1, len(p)):
+            candidates = []
+            for x, r in frontier:
+                keys_next = flags[level - 1].get(r, ())
+                if prefix[level] >= self.limit:
+                    # x is the only value below limit with the residues so far, the rest of them follow from it
+                    if x >= self.limit:
+                        self.pruned += 1
+                        continue
+                    r_next = x % p[level]
+                    if r_next in ab_sets[level] and r_next in keys_next:
+                        candidates.append((x, r_next))
+                else:
+                    for r_next in sorted(ab_sets[level].intersection(keys_next)):
+                        candidates.append((self.basis.extend(x, level, r_next), r_next))
+            self.explored += len(candidates)
+            # past the budget, the candidates with the smallest residues are kept
+            candidates = candidates[:self.cap(len(candidates))]
+            frontier = candidates
+        addresses = []
+        for x, r in frontier:
+            if x >= self.limit:
+                self.pruned += 1
+            else:
+                addresses.append(dec2addr(x))
+        return addresses
+
+    def reconstruct_csr(self, ab_list, adjacency):
+        # reconstruct over CSRAdjacency Flag structures, one vectorized step per level
+        p = self.basis.mod_list
+        prefix = self.basis.prefix
+        x = np.sort(np.array(ab_list[0], dtype=np.int64))
+        r = x.copy()
+        for level in range(1, len(p)):
+            abnormal = np.zeros(p[level], dtype=bool)
+            abnormal[ab_list[level]] = True
+            if prefix[level] >= self.limit:
+                # x is the only value below limit with the residues so far, the rest of them follow from it
+                below = x < self.limit
+                self.pruned += int((~below).sum())
+                x = x[below]
+                r_next = x % p[level]
+                keep = abnormal[r_next] & adjacency[level - 1].contains_edges(r[below], r_next, p[level])
+                x, r = x[keep], r_next[keep]
+            else:
+                parent, r_next = adjacency[level - 1].expand(r)
+                keep = abnormal[r_next]
+                parent, r_next = parent[keep], r_next[keep]
+                x_parent = x[parent]
+                x = x_parent + prefix[level] * ((r_next - x_parent) * self.basis.inverse[level] % p[level])
+                r = r_next
+            self.explored += len(x)
+            keep = self.cap(len(x))
+            x, r = x[:keep], r[:keep]
+        below = x < self.limit
+        self.pruned += int((~below).sum())
+        return decs2addr(x[below])
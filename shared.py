@@ -0,0 +1,98 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import parent_process, resource_tracker, shared_memory
+import os
+import sys
+
+import snapshot
+
+replica = None  # (segment name, FrozenSketch) attached by this worker process
+
+
+def publish(ssketch, name=None):
+    # copy the snapshot arrays of a closed epoch's sketch into a new shared memory segment and return it,
+    # the caller closes and unlinks the segment once no worker needs it any more
+    meta = snapshot.sketch_meta(ssketch)
+    arrays = snapshot.snapshot_arrays(ssketch)
+    segment = shared_memory.SharedMemory(name, create=True, size=snapshot.layout(meta, arrays)[2])
+    snapshot.pack_into(segment.buf, meta, arrays)
+    return segment
+
+
+def attach(name):
+    # read-only FrozenSketch over a published segment, its arrays are views on the shared memory
+    if sys.version_info >= (3, 13):
+        segment = shared_memory.SharedMemory(name, track=False)
+    else:
+        segment = shared_memory.SharedMemory(name)
+        if parent_process() is None:
+            # the resource tracker of a process unrelated to the publisher would unlink the segment at exit
+            resource_tracker.unregister(segment._name, 'shared_memory')
+    ssketch = snapshot.frozen(segment.buf)
+    ssketch.segment = segment
+    return ssketch
+
+
+def detach(ssketch):
+    # drop the arrays of an attached sketch and unmap its segment
+    segment = ssketch.segment
+    ssketch.__dict__.clear()
+    try:
+        segment.close()
+    except BufferError:
+        # views of the arrays are still referenced elsewhere, the mapping goes away with them
+        pass
+
+
+def use(name):
+    # the replica of the named segment in this process, replacing the previous one
+    global replica
+    if replica is None or replica[0] != name:
+        if replica is not None:
+            detach(replica[1])
+        replica = (name, attach(name))
+    return replica[1]
+
+
+def query(name, method, *args):
+    # worker: call a method of the replica by name, or a function taking the replica first
+    ssketch = use(name)
+    if isinstance(method, str):
+        return getattr(ssketch, method)(*args)
+    return method(ssketch, *args)
+
+
+class QueryPool:
+    # worker processes answering estimator and reconstruction queries on the last published epoch,
+    # each worker attaches to the shared segment once and reads it without copying
+
+    def __init__(self, workers=None, keep=2):
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self.keep = keep        # segments kept alive, so queries submitted before a publish still find theirs
+        self.segments = []
+
+    def publish(self, ssketch):
+        # publish a closed epoch, queries submitted from now on are answered on it
+        self.segments.append(publish(ssketch))
+        while len(self.segments) > self.keep:
+            segment = self.segments.pop(0)
+            segment.close()
+            segment.unlink()
+        return self.segments[-1].name
+
+    def submit(self, method, *args):
+        # future of query(method, *args) on the last published epoch
+        if not self.segments:
+            raise ValueError('no sketch has been published')
+        return self.executor.submit(query, self.segments[-1].name, method, *args)
+
+    def map(self, method, batches):
+        # results of method over each batch of arguments, computed in parallel
+        futures = [self.submit(method, batch) for batch in batches]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.executor.shutdown()
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
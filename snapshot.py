@@ -0,0 +1,101 @@
+import json
+import struct
+
+import numpy as np
+
+from frozen import FrozenSketch, pre_row_arrays, sketch_arrays
+
+# file layout: MAGIC, version and header length (uint32 each), JSON header, then every array
+# aligned to ALIGN bytes; the header records n, p, u, dt, ct, max_candidates and each array's dtype, shape
+# and offset
+MAGIC = b'SSKETCH\0'
+VERSION = 1
+ALIGN = 64
+PREFIX = struct.Struct('<8sII')
+
+
+def align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def layout(meta, arrays):
+    # header bytes, array offsets and total size of a snapshot
+    start = align(PREFIX.size)
+    while True:  # the offsets depend on the header length, which depends on the offsets
+        offset = start
+        entries = []
+        for name, array in arrays.items():
+            entries.append([name, array.dtype.str, list(array.shape), offset])
+            offset = align(offset + array.nbytes)
+        header = json.dumps(dict(meta, version=VERSION, arrays=entries)).encode()
+        if align(PREFIX.size + len(header)) == start:
+            return header, entries, offset
+        start = align(PREFIX.size + len(header))
+
+
+def pack_into(buffer, meta, arrays):
+    # write a snapshot into a writable buffer of at least layout()[2] bytes
+    header, entries, size = layout(meta, arrays)
+    view = memoryview(buffer)
+    PREFIX.pack_into(view, 0, MAGIC, VERSION, len(header))
+    view[PREFIX.size:PREFIX.size + len(header)] = header
+    for (name, dtype, shape, offset), array in zip(entries, arrays.values()):
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=view, offset=offset)
+        target[...] = array
+    return size
+
+
+def unpack(buffer):
+    # meta and arrays of a snapshot, as views on the buffer without copying
+    magic, version, header_len = PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError('not a SuperSketch snapshot')
+    if version != VERSION:
+        raise ValueError('unsupported snapshot version %d' % version)
+    meta = json.loads(bytes(buffer[PREFIX.size:PREFIX.size + header_len]))
+    arrays = {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+              for name, dtype, shape, offset in meta.pop('arrays')}
+    return meta, arrays
+
+
+def sketch_meta(ssketch):
+    return {'n': ssketch.n, 'p': list(ssketch.p), 'u': list(ssketch.u), 'dt': ssketch.dt, 'ct': ssketch.ct,
+            'max_candidates': ssketch.reconstructor.max_candidates}
+
+
+def snapshot_arrays(ssketch):
+    # arrays of a live or frozen sketch
+    if isinstance(ssketch, FrozenSketch):
+        arrays = {name: array for name, array in ssketch.arrays.items() if not name.startswith('pre')}
+        arrays.update(pre_row_arrays(ssketch))
+        return arrays
+    return sketch_arrays(ssketch)
+
+
+def save(ssketch, path):
+    # save the sketch, Flag structures, sc_frequency and pre_row_dict of an epoch
+    meta = sketch_meta(ssketch)
+    arrays = snapshot_arrays(ssketch)
+    header, entries, size = layout(meta, arrays)
+    with open(path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for (name, dtype, shape, offset), array in zip(entries, arrays.values()):
+            f.seek(offset)
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(size)
+
+
+def frozen(buffer):
+    # FrozenSketch over the snapshot held in a buffer, its arrays are views on the buffer
+    meta, arrays = unpack(buffer)
+    return FrozenSketch(meta['n'], meta['p'], meta['u'], arrays, meta['dt'], meta['ct'], meta.get('max_candidates'))
+
+
+def load(path, mmap=True):
+    # open a snapshot as a FrozenSketch, memory-mapped unless mmap is False
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+    return frozen(buffer)
@@ -0,0 +1,163 @@
+from array import array
+from bisect import bisect_left
+import sys
+
+import numpy as np
+
+
+def iter_bits(bitmap):
+    # positions of the set bits of an integer bitmap, in increasing order
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+
+class CompactRow:
+    # one row of a sub-sketch: its columns and a fixed-size port bitset per column
+    # sparse layout: sorted array of columns; dense layout: bitmap of p[x] bits
+    __slots__ = ('p', 'words', 'columns', 'bitmap', 'ports')
+
+    def __init__(self, p, u):
+        self.p = p
+        self.words = (u + 63) // 64   # uint64 words per port bitset
+        self.columns = array('I')     # sparse layout, sorted columns
+        self.bitmap = None            # dense layout, bit c is set if column c exists
+        self.ports = array('Q')       # port bitsets of the columns, in column order
+
+    def index(self, column):
+        # position of the column in column order, and whether it exists
+        if self.bitmap is None:
+            i = bisect_left(self.columns, column)
+            return i, i < len(self.columns) and self.columns[i] == column
+        return (self.bitmap & ((1 << column) - 1)).bit_count(), bool(self.bitmap >> column & 1)
+
+    def add(self, column, port):
+        # add the port to the column, return True if the column is new in this row
+        i, found = self.index(column)
+        start = i * self.words
+        if not found:
+            self.ports[start:start] = array('Q', bytes(8 * self.words))
+            if self.bitmap is None:
+                self.columns.insert(i, column)
+                if 4 * len(self.columns) > self.p // 8:
+                    self.promote()
+            else:
+                self.bitmap |= 1 << column
+        self.ports[start + port // 64] |= 1 << (port % 64)
+        return not found
+
+    def promote(self):
+        # switch from the sorted array to the dense bitmap once the array is the larger of the two
+        bitmap = 0
+        for column in self.columns:
+            bitmap |= 1 << column
+        self.bitmap = bitmap
+        self.columns = None
+
+    def port_bits(self, i):
+        # port bitset of the i-th column as an integer
+        bits = 0
+        for w in range(self.words):
+            bits |= self.ports[i * self.words + w] << (64 * w)
+        return bits
+
+    def __len__(self):
+        return len(self.ports) // self.words
+
+    def __contains__(self, column):
+        return self.index(column)[1]
+
+    def __iter__(self):
+        if self.bitmap is None:
+            return iter(self.columns)
+        return iter_bits(self.bitmap)
+
+    def keys(self):
+        return iter(self)
+
+    def __getitem__(self, column):
+        i, found = self.index(column)
+        if not found:
+            raise KeyError(column)
+        return frozenset(iter_bits(self.port_bits(i)))
+
+    def items(self):
+        for i, column in enumerate(self):
+            yield column, frozenset(iter_bits(self.port_bits(i)))
+
+    def nbytes(self):
+        # bytes held by this row
+        size = sys.getsizeof(self) + sys.getsizeof(self.ports)
+        if self.bitmap is None:
+            size += sys.getsizeof(self.columns)
+        else:
+            size += sys.getsizeof(self.bitmap)
+        return size
+
+
+class HotRow:
+    # a row past the hot row threshold: the exact bitmap of its p[x] columns, without per-column port sets
+    # dpci is taken from the port union of the row, so the estimates do not change and the row is bounded
+    # to p[x] / 8 bytes
+    __slots__ = ('bitmap', 'count')
+
+    def __init__(self, p, columns=()):
+        self.bitmap = bytearray((p + 7) // 8)
+        self.count = 0
+        for column in columns:
+            self.add(column)
+
+    def add(self, column, port=None):
+        # add the column, return True if it is new in this row
+        byte, bit = column >> 3, 1 << (column & 7)
+        if self.bitmap[byte] & bit:
+            return False
+        self.bitmap[byte] |= bit
+        self.count += 1
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, column):
+        return bool(self.bitmap[column >> 3] >> (column & 7) & 1)
+
+    def __iter__(self):
+        bits = np.unpackbits(np.frombuffer(self.bitmap, dtype=np.uint8), bitorder='little')
+        return iter(np.flatnonzero(bits).tolist())
+
+    def keys(self):
+        return iter(self)
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.bitmap)
+
+
+class CompactSubSketch(dict):
+    # sub-sketch SSx stored as {row: CompactRow}
+
+    def __init__(self, p, u):
+        super().__init__()
+        self.p = p
+        self.u = u
+
+    def add(self, row, column1, column2):
+        # add the cell, return True if column1 is new in the row
+        if row not in self:
+            self[row] = CompactRow(self.p, self.u)
+        return self[row].add(column1, column2)
+
+
+def sizeof(obj):
+    # deep size in bytes of a sub-sketch or Flag structure
+    if isinstance(obj, (CompactRow, HotRow)):
+        return obj.nbytes()
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + sizeof(value)
+    elif isinstance(obj, (set, frozenset, list)):
+        for item in obj:
+            size += sizeof(item)
+    return size
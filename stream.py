@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from adjacency import KeySet
+from codec import addrs2dec
+from readers import iter_netflow5, iter_pcap, trace_format
+
+COLUMNS = ['Src IP', 'Dst IP', 'Dst Port']
+
+
+def iter_batches(path, chunksize=1 << 16):
+    # (src, des, port) integer arrays of a CSV, pcap or NetFlow v5 trace, read chunksize flows at a time
+    trace = trace_format(path)
+    if trace == 'pcap':
+        yield from iter_pcap(path, chunksize)
+        return
+    if trace == 'netflow5':
+        yield from iter_netflow5(path, chunksize)
+        return
+    for chunk in pd.read_csv(path, usecols=COLUMNS, chunksize=chunksize):
+        yield (addrs2dec(chunk['Src IP'].to_numpy()), addrs2dec(chunk['Dst IP'].to_numpy()),
+               chunk['Dst Port'].to_numpy(dtype=np.int64))
+
+
+def ingest(ssketch, batches):
+    # feed a stream of (src, des, port) batches to the sketch, return the number of flows
+    records = 0
+    for src, des, port in batches:
+        ssketch.update_batch(src, des, port)
+        records += len(src)
+    return records
+
+
+class TraceStats:
+    # ground truth dc/dpc/sc of a trace, collected batch by batch
+
+    def __init__(self):
+        self.records = 0
+        self.src_des = KeySet()     # src << 32 | des
+        self.src_port = KeySet()    # src << 16 | port
+        self.des_src = KeySet()     # des << 32 | src
+
+    def update(self, src, des, port):
+        src = np.asarray(src, dtype=np.uint64)
+        des = np.asarray(des, dtype=np.uint64)
+        port = np.asarray(port, dtype=np.uint64)
+        self.records += len(src)
+        self.src_des.add(src << np.uint64(32) | des)
+        self.src_port.add(src << np.uint64(16) | port)
+        self.des_src.add(des << np.uint64(32) | src)
+
+    @staticmethod
+    def count(keys, shift):
+        # distinct addresses in the high bits of the keys and how many keys each one has
+        addrs, counts = np.unique(keys >> np.uint64(shift), return_counts=True)
+        return addrs.astype(np.int64), counts
+
+    def dc(self):
+        # sources and their real dc
+        return self.count(self.src_des.unique(), 32)
+
+    def dpc(self):
+        # sources and their real dpc
+        return self.count(self.src_port.unique(), 16)
+
+    def sc(self):
+        # destinations and their real sc
+        return self.count(self.des_src.unique(), 32)
@@ -1,46 +1,66 @@
-from functools import reduce
+import copy
+from functools import lru_cache
 import math
 
+import numpy as np
 
-def egcd(a, b):
-    # Extended Euclidean algorithm
-    if 0 == b:
-        return 1, 0, a
-    x, y, q = egcd(b, a % b)
-    x, y = y, (x - a // b * y)
-    return x, y, q
+from adjacency import EdgeLog
+from codec import addr2dec, addrs2dec
+from metrics import instrumented
+from recon import Reconstructor
+from storage import CompactSubSketch, HotRow, sizeof
+from topk import SuspectIndex
 
 
-def chinese_remainder(mod_list, remainder_list):
-    # Chinese Remainder Theorem (CRT)
-    mod_product = reduce(lambda x, y: x * y, mod_list)
-    mi_list = [mod_product // x for x in mod_list]
-    mi_inverse = [egcd(mi_list[i], mod_list[i])[0] for i in range(len(mi_list))]
-    x = 0
-    for i in range(len(remainder_list)):
-        x += mi_list[i] * mi_inverse[i] * remainder_list[i]
-        x %= mod_product
-    return x
+@lru_cache(maxsize=None)
+def estimator_table(m):
+    # estimates -m*ln((m-k)/m) for k = 0,...,m occupied buckets out of m, shared by all sketches
+    table = [0]
+    for k in range(1, m + 1):
+        v = m - k
+        if v == 0:
+            v = 1
+        table.append(round((-m) * math.log(v / m), 2))
+    return table
 
 
-def addr2dec(addr):
-    # Dotted decimal notation IP  to Decimal integer IP
-    items = [int(x) for x in addr.split(".")]
-    return sum([items[i] << [24, 16, 8, 0][i] for i in range(4)])
+@lru_cache(maxsize=None)
+def estimator_array(m):
+    # estimator_table(m) as a NumPy array
+    return np.array(estimator_table(m))
 
 
-def dec2addr(dec):
-    # Decimal integer IP TO Dotted decimal notation IP
-    return ".".join([str(dec >> x & 0xff) for x in [24, 16, 8, 0]])
+def running_sum(values):
+    # left-to-right sum of an array, matching a sequential Python loop bit for bit
+    if len(values) == 0:
+        return 0
+    return float(np.cumsum(values)[-1])
+
+
+def previous_estimates(pre_rows, rows):
+    # [dci, dpci] of each row in the previous epoch, [0, 0] for rows that did not exist
+    if hasattr(pre_rows, 'lookup'):
+        return pre_rows.lookup(rows)
+    return np.array([pre_rows.get(row, (0, 0)) for row in rows.tolist()], dtype=float).reshape(-1, 2)
+
+
+def first_occurrence(keys):
+    # indices of the first occurrence of every distinct key, in the order they appear
+    first = np.unique(keys, return_index=True)[1]
+    first.sort()
+    return first
 
 
 class SuperSketch:
     # operations and functions of supersketch
 
-    def __init__(self, n, p, u):
+    def __init__(self, n, p, u, storage='dict', max_candidates=None, flags='sets', hot_threshold=None, top_k=None):
         self.n = n
         self.p = p
         self.u = u
+        self.storage = storage  # 'dict': {row:{column1:{column2}}}, 'compact': rows of sorted arrays/bitmaps
+        self.flags = flags      # 'sets': Flag dicts of sets, 'log': EdgeLogs compacted to CSR at epoch close
+        self.hot_threshold = hot_threshold  # rows with more columns become HotRows of bounded size, None: never
         self.dt = 0.003         # percentage thresholds for super spreader/receiver identification
         self.ct = 0.002         # percentage thresholds for super changer identification
         self.sketch = None
@@ -49,12 +69,33 @@ class SuperSketch:
         self.row_change = None
         self.pre_row_dict = None
         self.sc_frequency = None
+        self.row_ports = None   # row_ports[x]   {row: bitmap of the ports of all columns in the row}
+        self.dc_table = [estimator_table(x) for x in self.p]    # dci/sci indexed by the number of columns/rows
+        self.dpc_table = [estimator_table(x) for x in self.u]   # dpci indexed by the number of ports
+        self.dc_array = [estimator_array(x) for x in self.p]     # the same tables for vectorized lookups
+        self.dpc_array = [estimator_array(x) for x in self.u]
+        # CRT basis and optional cap: max_candidates partial candidates kept per epoch over recon_sip and recon_dip,
+        # those with the smallest residues first, the rest are counted as truncated
+        self.reconstructor = Reconstructor(self.p, max_candidates)
+        self.metrics = None     # optional metrics.Metrics timing the update, estimator and detection calls
+        self.dedup = None       # optional dedup.DedupFilter dropping the triples already seen in the epoch
+        self.dense = None       # dense[i] = (dci, dpci, sci) arrays of SSi cached by the bulk estimators
+        self.dirty_rows = None  # rows/columns of SSi updated since dense[i] was computed
+        self.dirty_cols = None
+        self.dirty_size = None  # number of entries recorded in dirty_rows[i], at most p[i] / 4
+        self.top_k = top_k      # rows/columns ranked by each suspects[i] for current_suspects, None: not kept
+        self.suspects = None    # suspects[i] = topk.SuspectIndex of SSi, rebuilt at each epoch
 
     def generate_ss(self):
         # sketch initialization
         self.sketch = []
+        self.row_ports = [{} for i in range(self.n)]
+        self.sc_frequency = [{} for i in range(self.n)]
         for i in range(self.n):
-            a = {}
+            if self.storage == 'compact':
+                a = CompactSubSketch(self.p[i], self.u[i])
+            else:
+                a = {}
             self.sketch.append(a)
 
     def generate_flag(self):
@@ -62,8 +103,12 @@ class SuperSketch:
         self.Flag_row = []
         self.Flag_column = []
         for i in range(self.n - 1):
-            a = {}
-            b = {}
+            if self.flags == 'log':
+                a = EdgeLog(self.p[i + 1])
+                b = EdgeLog(self.p[i + 1])
+            else:
+                a = {}
+                b = {}
             self.Flag_row.append(a)
             self.Flag_column.append(b)
 
@@ -71,85 +116,401 @@ class SuperSketch:
         # initialize
         self.generate_ss()
         self.generate_flag()
-
+        self.dense = None
+        self.reconstructor.reset()
+        self.build_suspects()
+        if self.dedup is not None:
+            self.dedup.reset()
+
+    def clear(self):
+        # empty the sketch in place for the next epoch, keeping pre_row_dict for changer detection
+        if self.sketch is None:
+            self.initialize()
+            return
+        for a in self.sketch + self.row_ports + self.sc_frequency + self.Flag_row + self.Flag_column:
+            a.clear()
+        self.dense = None
+        self.reconstructor.reset()
+        self.build_suspects()
+        if self.dedup is not None:
+            self.dedup.reset()
+
+    def spawn(self):
+        # an empty, initialized sketch with the same configuration (storage, flags, dt, ct, max_candidates,
+        # hot_threshold, top_k, dedup) to build over other flows, small enough to pickle for a worker process
+        template = copy.copy(self)
+        template.row_change = None
+        template.pre_row_dict = None
+        template.metrics = None
+        template.dirty_rows = None
+        template.dirty_cols = None
+        template.dirty_size = None
+        template.reconstructor = Reconstructor(self.p, self.reconstructor.max_candidates)
+        if self.dedup is not None:
+            template.dedup = copy.deepcopy(self.dedup)
+        template.initialize()
+        return template
+
+    @instrumented('update')
     def update(self, source, destination, port):
         # update operation
         src = addr2dec(source)
         des = addr2dec(destination)
+        if self.dedup is not None and self.dedup.seen(src, des, int(port)):
+            # a repeated triple cannot change the sketch
+            return
 
         for x in range(self.n):
             row = int(src % self.p[x])
             column1 = int(des % self.p[x])
             column2 = int(port % self.u[x])
+            if self.insert_cell(x, row, column1, column2) and self.dense is not None:
+                self.mark_dirty(x, row, column1, 1)
+            if x != self.n-1:
+                self.insert_flag(self.Flag_row[x], row, int(src % self.p[x+1]))
+                self.insert_flag(self.Flag_column[x], column1, int(des % self.p[x + 1]))
+            else:
+                continue
 
-            # sketch[x]   {row:{column1:{column2,...},...},...}
-            if row in self.sketch[x]:
-                if column1 in self.sketch[x][row]:
-                    self.sketch[x][row][column1].add(column2)
-                else:
-                    self.sketch[x][row][column1] = {column2}
+    def insert_cell(self, x, row, column1, column2):
+        # sketch[x]   {row:{column1:{column2,...},...},...}
+        # returns whether the estimates of the row or column can have changed
+        if self.storage == 'compact':
+            new_column = self.sketch[x].add(row, column1, column2)
+        elif row in self.sketch[x]:
+            columns = self.sketch[x][row]
+            new_column = column1 not in columns
+            if type(columns) is HotRow:
+                columns.add(column1)
+            elif new_column:
+                columns[column1] = {column2}
             else:
-                self.sketch[x][row] = {column1: {column2}}
-            # Flag_row[x]   {row:{row_next,...},...}
-            # Flag_column[x]    {column1:{column1_next,...},...}
-            if x != self.n-1:
-                if row in self.Flag_row[x]:
-                    self.Flag_row[x][row].add(int(src % self.p[x+1]))
-                else:
-                    self.Flag_row[x][row] = {int(src % self.p[x+1])}
+                columns[column1].add(column2)
+        else:
+            new_column = True
+            self.sketch[x][row] = {column1: {column2}}
+        ports = self.row_ports[x].get(row, 0)
+        self.row_ports[x][row] = ports | (1 << column2)
+        # sc_frequency[x]   {column1: number of rows that contain column1}
+        if new_column:
+            self.sc_frequency[x][column1] = self.sc_frequency[x].get(column1, 0) + 1
+            if self.hot_threshold is not None:
+                self.check_hot(x, row)
+        if self.suspects is not None:
+            self.track_cell(x, row, column1, new_column, ports)
+        return new_column or not ports >> column2 & 1
+
+    def mark_dirty(self, x, rows, cols, size):
+        # record rows/columns of SSx to refresh in dense[x], past p[x] / 4 entries dense[x] is dropped
+        # and rebuilt by the next query instead, so the backlog stays bounded
+        if self.dense[x] is None:
+            return
+        self.dirty_size[x] += size
+        if self.dirty_size[x] > self.p[x] // 4:
+            self.dense[x] = None
+            self.dirty_rows[x] = []
+            self.dirty_cols[x] = []
+            self.dirty_size[x] = 0
+        else:
+            self.dirty_rows[x].append(rows)
+            self.dirty_cols[x].append(cols)
+
+    def track_cell(self, x, row, column1, new_column, ports):
+        # bring the running totals and top-k of SSx up to date with the cell just inserted
+        suspects = self.suspects[x]
+        if new_column:
+            columns = len(self.sketch[x][row])
+            suspects.row_columns(row, columns - 1, columns)
+            frequency = self.sc_frequency[x][column1]
+            suspects.column_rows(column1, frequency - 1, frequency)
+        if self.row_ports[x][row] != ports:
+            suspects.row_ports(row, ports.bit_count(), self.row_ports[x][row].bit_count())
+
+    def set_previous(self, pre_row_dict):
+        # compare the epoch with the row estimates pre_row_dict of the previous one, rebuilding the
+        # suspect index if it was kept against other estimates
+        if pre_row_dict is not self.pre_row_dict:
+            self.pre_row_dict = pre_row_dict
+            self.build_suspects()
+
+    def build_suspects(self):
+        # running totals and top-k of every sub-sketch from its current content
+        if self.top_k is None:
+            self.suspects = None
+            return
+        self.suspects = []
+        for i in range(self.n):
+            pre_rows = self.pre_row_dict[i] if self.pre_row_dict is not None else None
+            if hasattr(pre_rows, 'lookup'):
+                pre_rows = dict(zip(pre_rows.rows.tolist(), pre_rows.values.tolist()))
+            suspects = SuspectIndex(self.dc_table[i], self.dpc_table[i], self.top_k, pre_rows)
+            for row, columns in self.sketch[i].items():
+                suspects.row_columns(row, 0, len(columns))
+                suspects.row_ports(row, 0, self.row_ports[i][row].bit_count())
+            for column, frequency in self.sc_frequency[i].items():
+                suspects.column_rows(column, 0, frequency)
+            self.suspects.append(suspects)
+
+    def check_hot(self, x, row):
+        # replace the row by a HotRow once it has more than hot_threshold columns
+        columns = self.sketch[x][row]
+        if len(columns) > self.hot_threshold and type(columns) is not HotRow:
+            self.sketch[x][row] = HotRow(self.p[x], columns)
+
+    def merge_hot_row(self, x, row, columns, ports):
+        # merge the columns and port union of a row when either side is a HotRow, the result is a HotRow
+        mine = self.sketch[x].get(row)
+        if type(mine) is not HotRow:
+            mine = self.sketch[x][row] = HotRow(self.p[x], mine or ())
+        for column1 in columns:
+            if mine.add(column1):
+                self.sc_frequency[x][column1] = self.sc_frequency[x].get(column1, 0) + 1
+        self.row_ports[x][row] = self.row_ports[x].get(row, 0) | ports
+
+    @staticmethod
+    def insert_flag(flag, key, key_next):
+        # Flag_row[x]   {row:{row_next,...},...}
+        # Flag_column[x]    {column1:{column1_next,...},...}
+        if isinstance(flag, EdgeLog):
+            flag.add_edge(key, key_next)
+        elif key in flag:
+            flag[key].add(key_next)
+        else:
+            flag[key] = {key_next}
+
+    @instrumented('update_batch')
+    def update_batch(self, src, des, port):
+        # update operation for a batch of flows
+        # src/des: uint32 integer (or dotted decimal) addresses, port: uint16 destination ports
+        src = addrs2dec(src)
+        des = addrs2dec(des)
+        port = np.asarray(port, dtype=np.int64)
+        if self.metrics is not None:
+            self.metrics.count('flows', len(src))
+        if self.dedup is not None:
+            fresh = self.dedup.fresh(src, des, port)
+            src, des, port = src[fresh], des[fresh], port[fresh]
+        if len(src) == 0:
+            return
+        p = np.asarray(self.p, dtype=np.int64)[:, None]
+        u = np.asarray(self.u, dtype=np.int64)[:, None]
+        rows = src[None, :] % p              # rows[x] = src % p[x]
+        columns1 = des[None, :] % p          # columns1[x] = des % p[x]
+        columns2 = port[None, :] % u         # columns2[x] = port % u[x]
 
-                if column1 in self.Flag_column[x]:
-                    self.Flag_column[x][column1].add(int(des % self.p[x + 1]))
+        for x in range(self.n):
+            # repeated cells are no-ops, so only the first occurrence of each one is applied, in flow order
+            keys = (rows[x] * self.p[x] + columns1[x]) * self.u[x] + columns2[x]
+            first = first_occurrence(keys)
+            if self.dense is not None:
+                self.mark_dirty(x, rows[x][first], columns1[x][first], len(first))
+            self.insert_cells(x, rows[x][first], columns1[x][first], columns2[x][first])
+            if x != self.n-1:
+                self.insert_flag_batch(self.Flag_row[x], rows[x], rows[x + 1], self.p[x + 1])
+                self.insert_flag_batch(self.Flag_column[x], columns1[x], columns1[x + 1], self.p[x + 1])
+
+    def insert_cells(self, x, rows, columns1, columns2):
+        # bulk insert_cell over distinct cells: only the set inserts run per cell, the row_ports unions,
+        # sc_frequency counts, hot row checks and suspect totals are applied once per row or column
+        sketch = self.sketch[x]
+        if self.storage == 'compact':
+            add = sketch.add
+            new = [add(row, column1, column2) for row, column1, column2 in
+                   zip(rows.tolist(), columns1.tolist(), columns2.tolist())]
+        else:
+            new = []
+            append = new.append
+            for row, column1, column2 in zip(rows.tolist(), columns1.tolist(), columns2.tolist()):
+                columns = sketch.get(row)
+                if columns is None:
+                    sketch[row] = {column1: {column2}}
+                    append(True)
+                elif type(columns) is HotRow:
+                    append(columns.add(column1))
                 else:
-                    self.Flag_column[x][column1] = {int(des % self.p[x + 1])}
+                    ports = columns.get(column1)
+                    if ports is None:
+                        columns[column1] = {column2}
+                        append(True)
+                    else:
+                        ports.add(column2)
+                        append(False)
+        new = np.array(new, dtype=bool)
+
+        # port union of every row, one uint64 word array per row turned into its integer bitmap
+        unique_rows, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        words = (self.u[x] + 63) // 64
+        bits = np.zeros((len(unique_rows), words), dtype='<u8')
+        np.bitwise_or.at(bits, (inverse, columns2 // 64), np.left_shift(np.uint64(1), (columns2 % 64).astype(np.uint64)))
+        data = bits.tobytes()
+        step = 8 * words
+        order = np.argsort(first)  # rows in the order they first appear, like the per-cell path
+        row_ports = self.row_ports[x]
+        changed_ports = []
+        for row, start in zip(unique_rows[order].tolist(), (order * step).tolist()):
+            ports = row_ports.get(row, 0)
+            union = ports | int.from_bytes(data[start:start + step], 'little')
+            if union != ports:
+                row_ports[row] = union
+                changed_ports.append((row, ports))
+
+        # sc_frequency[x]   {column1: number of rows that contain column1}
+        sc_frequency = self.sc_frequency[x]
+        new_columns, first, counts = np.unique(columns1[new], return_index=True, return_counts=True)
+        order = np.argsort(first)
+        new_columns, counts = new_columns[order].tolist(), counts[order].tolist()
+        for column1, count in zip(new_columns, counts):
+            sc_frequency[column1] = sc_frequency.get(column1, 0) + count
+        grown_rows, first, added = np.unique(rows[new], return_index=True, return_counts=True)
+        order = np.argsort(first)
+        grown_rows, added = grown_rows[order].tolist(), added[order].tolist()
+        if self.hot_threshold is not None:
+            for row in grown_rows:
+                self.check_hot(x, row)
+        if self.suspects is not None:
+            suspects = self.suspects[x]
+            for row, count in zip(grown_rows, added):
+                columns = len(sketch[row])
+                suspects.row_columns(row, columns - count, columns)
+            for column1, count in zip(new_columns, counts):
+                frequency = sc_frequency[column1]
+                suspects.column_rows(column1, frequency - count, frequency)
+            for row, ports in changed_ports:
+                suspects.row_ports(row, ports.bit_count(), row_ports[row].bit_count())
+
+    def insert_flag_batch(self, flag, keys, keys_next, p_next):
+        # add the (key, key_next) edges of a batch to a Flag structure
+        if isinstance(flag, EdgeLog):
+            flag.add_edges(keys, keys_next)
+            return
+        first = first_occurrence(keys * p_next + keys_next)
+        for key, key_next in zip(keys[first].tolist(), keys_next[first].tolist()):
+            keys_next_set = flag.get(key)
+            if keys_next_set is None:
+                flag[key] = {key_next}
             else:
-                continue
+                keys_next_set.add(key_next)
 
     def process_data(self, table, low_rows, up_rows):
         # process flows
-        for i in range(low_rows, up_rows):
-            source = table.loc[i, 'Src IP']
-            destination = table.loc[i, 'Dst IP']
-            desport = table.loc[i, 'Dst Port']
-            self.update(source, destination, desport)
+        chunk = table.iloc[low_rows:up_rows]
+        src = addrs2dec(chunk['Src IP'].to_numpy())
+        des = addrs2dec(chunk['Dst IP'].to_numpy())
+        desport = chunk['Dst Port'].to_numpy(dtype=np.uint16)
+        self.update_batch(src, des, desport)
+
+    @instrumented('merge')
+    def merge(self, other):
+        # merge a sketch built with the same n, p and u over other flows into this one
+        if self.n != other.n or list(self.p) != list(other.p) or list(self.u) != list(other.u) or \
+                self.flags != other.flags:
+            raise ValueError('only sketches with the same n, p, u and flags can be merged')
+        self.dense = None
+        for x in range(self.n):
+            if self.storage == 'compact' or other.storage == 'compact':
+                for row, columns in other.sketch[x].items():
+                    if type(columns) is HotRow or type(self.sketch[x].get(row)) is HotRow:
+                        self.merge_hot_row(x, row, columns, other.row_ports[x][row])
+                        continue
+                    for column1, ports in columns.items():
+                        for column2 in ports:
+                            self.insert_cell(x, row, column1, column2)
+            else:
+                for row, columns in other.sketch[x].items():
+                    if type(columns) is HotRow or type(self.sketch[x].get(row)) is HotRow:
+                        self.merge_hot_row(x, row, columns, other.row_ports[x][row])
+                        continue
+                    mine = self.sketch[x].setdefault(row, {})
+                    for column1, ports in columns.items():
+                        if column1 in mine:
+                            mine[column1] |= ports
+                        else:
+                            mine[column1] = set(ports)
+                            self.sc_frequency[x][column1] = self.sc_frequency[x].get(column1, 0) + 1
+                    self.row_ports[x][row] = self.row_ports[x].get(row, 0) | other.row_ports[x][row]
+                    if self.hot_threshold is not None:
+                        self.check_hot(x, row)
+            if x != self.n - 1:
+                for flag, other_flag in ((self.Flag_row[x], other.Flag_row[x]),
+                                         (self.Flag_column[x], other.Flag_column[x])):
+                    if isinstance(flag, EdgeLog):
+                        flag.add(other_flag.unique())
+                        flag.adjacency = None
+                        continue
+                    for key, keys_next in other_flag.items():
+                        if key in flag:
+                            flag[key] |= keys_next
+                        else:
+                            flag[key] = set(keys_next)
+        self.build_suspects()
+
+    def __getstate__(self):
+        # the estimator tables are rebuilt from p and u instead of being pickled, metrics stay behind
+        state = self.__dict__.copy()
+        for name in ('dc_table', 'dpc_table', 'dc_array', 'dpc_array'):
+            del state[name]
+        state['metrics'] = None
+        state['dense'] = None
+        state['dirty_rows'] = state['dirty_cols'] = state['dirty_size'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dc_table = [estimator_table(x) for x in self.p]
+        self.dpc_table = [estimator_table(x) for x in self.u]
+        self.dc_array = [estimator_array(x) for x in self.p]
+        self.dpc_array = [estimator_array(x) for x in self.u]
+
+    def occupancy(self):
+        # gauges of how full the sub-sketches and Flag structures are
+        gauges = {}
+        for i in range(self.n):
+            columns = [len(self.sketch[i][row]) for row in self.sketch[i]]
+            gauges['rows%d' % i] = len(columns)
+            gauges['cells%d' % i] = sum(columns)
+            gauges['max_columns%d' % i] = max(columns, default=0)
+            gauges['sc_columns%d' % i] = len(self.sc_frequency[i])
+        if self.flags == 'log':
+            gauges['flag_edges'] = sum(len(flag) for flag in self.Flag_row + self.Flag_column)
+        else:
+            gauges['flag_edges'] = sum(len(flag[key]) for flag in self.Flag_row + self.Flag_column for key in flag)
+        gauges['recon_explored'] = self.reconstructor.explored
+        gauges['recon_pruned'] = self.reconstructor.pruned
+        gauges['recon_truncated'] = self.reconstructor.truncated
+        if self.dedup is not None:
+            gauges['dedup_hit_ratio'] = self.dedup.hit_ratio()
+            gauges['dedup_resets'] = self.dedup.resets
+        gauges['memory_bytes'] = self.memory_usage()
+        return gauges
+
+    def memory_usage(self):
+        # bytes used by the sketch, row port unions, sc_frequency and Flag structures
+        return sum(sizeof(a) for a in self.sketch + self.row_ports + self.sc_frequency + self.Flag_row +
+                   self.Flag_column)
 
     def cal_dci(self, i, row):
         # calculate the dc(destination cardinality) of the row in SSi
         if row not in self.sketch[i]:  # if the row doesn't exist in sketch, its dci is 0.
             dci = 0
         else:
-            v = self.p[i] - len(self.sketch[i][row])
-            if v == 0:
-                v = 1
-            dci = round((-self.p[i]) * math.log(v / self.p[i]), 2)
+            dci = self.dc_table[i][len(self.sketch[i][row])]
         return dci
 
     def cal_dpci(self, i, row):
         # calculate the dpc(destination port cardinality) of the row in SSi
-        if row not in self.sketch[i]:  # if the row doesn't exist in sketch, its dpci is 0.
+        if row not in self.row_ports[i]:  # if the row doesn't exist in sketch, its dpci is 0.
             dpci = 0
         else:
-            dp_set = set()
-            for column in self.sketch[i][row]:
-                dp_set = dp_set | self.sketch[i][row][column]
-            v = self.u[i] - len(dp_set)
-            if v == 0:
-                v = 1
-            dpci = round((-self.u[i]) * math.log(v / self.u[i]), 2)
+            dpci = self.dpc_table[i][self.row_ports[i][row].bit_count()]
         return dpci
 
     def cal_sci(self, i, column):
         # calculate the sc(source cardinality) of the column in SSi
-        freq = self.sc_frequency[i].get(column, 0)
-        v = self.p[i] - freq
-        if v == self.p[i]:  # if the column doesn't exist in sketch, its sci is 0.
-            sci = 0
-        else:
-            if v == 0:
-                v = 1
-            sci = round((-self.p[i]) * math.log(v / self.p[i]), 2)
+        # if the column doesn't exist in sketch, its frequency and sci are 0.
+        sci = self.dc_table[i][self.sc_frequency[i].get(column, 0)]
         return sci
 
+    @instrumented('cal_dc')
     def cal_dc(self, source):
         # calculate the dc of source
         src = addr2dec(source)
@@ -161,6 +522,7 @@ class SuperSketch:
         dc = int(min(dc_list))
         return dc
 
+    @instrumented('cal_dpc')
     def cal_dpc(self, source):
         # calculate the dpc of source
         src = addr2dec(source)
@@ -172,6 +534,7 @@ class SuperSketch:
         dpc = int(min(dpc_list))
         return dpc
 
+    @instrumented('cal_sc')
     def cal_sc(self, destination):
         # calculate the sc of destination
         des = addr2dec(destination)
@@ -183,144 +546,163 @@ class SuperSketch:
         sc = int(min(sc_list))
         return sc
 
-    def recon_sip(self, abrow_list, cur=0, num_list=None, sip_list=None, rownum=None):
+    def dense_estimates(self, i):
+        # (dci, dpci, sci) of every row/column index of SSi, 0 where unoccupied
+        # cached until the next epoch, only the rows and columns updated since the last call are recomputed
+        if self.dense is None:
+            self.dense = [None] * self.n
+            self.dirty_rows = [[] for x in range(self.n)]
+            self.dirty_cols = [[] for x in range(self.n)]
+            self.dirty_size = [0] * self.n
+        if self.dirty_rows[i] and self.dense[i] is not None:
+            rows = np.unique(np.hstack(self.dirty_rows[i]))
+            cols = np.unique(np.hstack(self.dirty_cols[i]))
+            if 4 * (len(rows) + len(cols)) > self.p[i]:
+                self.dense[i] = None
+            else:
+                dci, dpci, sci = self.dense[i]
+                row_list = rows.tolist()
+                ncols = [len(self.sketch[i].get(row, ())) for row in row_list]
+                nports = [self.row_ports[i].get(row, 0).bit_count() for row in row_list]
+                dci[rows] = self.dc_array[i][ncols]
+                dpci[rows] = self.dpc_array[i][nports]
+                sci[cols] = self.dc_array[i][[self.sc_frequency[i].get(col, 0) for col in cols.tolist()]]
+        if self.dense[i] is None:
+            rows, ncols, nports = self.row_arrays(i)
+            cols, freq = self.col_arrays(i)
+            dci = np.zeros(self.p[i])
+            dpci = np.zeros(self.p[i])
+            sci = np.zeros(self.p[i])
+            dci[rows] = self.dc_array[i][ncols]
+            dpci[rows] = self.dpc_array[i][nports]
+            sci[cols] = self.dc_array[i][freq]
+            self.dense[i] = (dci, dpci, sci)
+        self.dirty_rows[i] = []
+        self.dirty_cols[i] = []
+        self.dirty_size[i] = 0
+        return self.dense[i]
+
+    def dense_dci(self, i):
+        # dci of every row index of SSi, 0 for unoccupied rows
+        return self.dense_estimates(i)[0]
+
+    def dense_dpci(self, i):
+        # dpci of every row index of SSi, 0 for unoccupied rows
+        return self.dense_estimates(i)[1]
+
+    def dense_sci(self, i):
+        # sci of every column index of SSi, 0 for unoccupied columns
+        return self.dense_estimates(i)[2]
+
+    @instrumented('cal_dc_many')
+    def cal_dc_many(self, sources):
+        # calculate the dc of an array of sources
+        src = addrs2dec(sources)
+        dc = np.full(len(src), np.inf)
+        for i in range(self.n):
+            dc = np.minimum(dc, self.dense_dci(i)[src % self.p[i]])
+        return dc.astype(np.int64)
+
+    @instrumented('cal_dpc_many')
+    def cal_dpc_many(self, sources):
+        # calculate the dpc of an array of sources
+        src = addrs2dec(sources)
+        dpc = np.full(len(src), np.inf)
+        for i in range(self.n):
+            dpc = np.minimum(dpc, self.dense_dpci(i)[src % self.p[i]])
+        return dpc.astype(np.int64)
+
+    @instrumented('cal_sc_many')
+    def cal_sc_many(self, destinations):
+        # calculate the sc of an array of destinations
+        des = addrs2dec(destinations)
+        sc = np.full(len(des), np.inf)
+        for i in range(self.n):
+            sc = np.minimum(sc, self.dense_sci(i)[des % self.p[i]])
+        return sc.astype(np.int64)
+
+    @instrumented('recon_sip')
+    def recon_sip(self, abrow_list):
         # reversibly reconstruct abnormal source addresses
-        if cur == 0:
-            sip_list = []
-            for num in abrow_list[0]:
-                original_list = [num]
-                for flag in self.Flag_row[cur][num]:
-                    if flag in abrow_list[cur + 1]:
-                        num_list = original_list.copy()
-                        num_list.append(flag)
-                        rownum = flag
-                        self.recon_sip(abrow_list, cur + 1, num_list, sip_list, rownum)
-                    else:
-                        continue
-            return sip_list
-        elif cur == self.n - 1:
-            ipaddress = dec2addr(chinese_remainder(self.p, num_list))
-            sip_list.append(ipaddress)
-        else:
-            original_list = num_list.copy()
-            for flag in self.Flag_row[cur][rownum]:
-                if flag in abrow_list[cur + 1]:
-                    num_list = original_list.copy()
-                    num_list.append(flag)
-                    rownum = flag
-                    self.recon_sip(abrow_list, cur + 1, num_list, sip_list, rownum)
-                else:
-                    continue
+        if self.flags == 'log':
+            return self.reconstructor.reconstruct_csr(abrow_list, [flag.csr() for flag in self.Flag_row])
+        return self.reconstructor.reconstruct(abrow_list, self.Flag_row)
 
-    def recon_dip(self, abcol_list, cur=0, num_list=None, dip_list=None, colnum=None):
+    @instrumented('recon_dip')
+    def recon_dip(self, abcol_list):
         # reversibly reconstruct abnormal destination addresses
-        if cur == 0:
-            dip_list = []
-            for num in abcol_list[0]:
-                original_list = [num]
-                for flag in self.Flag_column[cur][num]:
-                    if flag in abcol_list[cur + 1]:
-                        num_list = original_list.copy()
-                        num_list.append(flag)
-                        colnum = flag
-                        self.recon_dip(abcol_list, cur + 1, num_list, dip_list, colnum)
-                    else:
-                        continue
-            return dip_list
-        elif cur == self.n - 1:
-            ipaddress = dec2addr(chinese_remainder(self.p, num_list))
-            dip_list.append(ipaddress)
-        else:
-            original_list = num_list.copy()
-            for flag in self.Flag_column[cur][colnum]:
-                if flag in abcol_list[cur + 1]:
-                    num_list = original_list.copy()
-                    num_list.append(flag)
-                    colnum = flag
-                    self.recon_dip(abcol_list, cur + 1, num_list, dip_list, colnum)
-                else:
-                    continue
-
+        if self.flags == 'log':
+            return self.reconstructor.reconstruct_csr(abcol_list, [flag.csr() for flag in self.Flag_column])
+        return self.reconstructor.reconstruct(abcol_list, self.Flag_column)
+
+    def row_arrays(self, i):
+        # occupied rows of SSi with their number of columns and number of ports
+        rows = list(self.sketch[i])
+        ncols = np.fromiter(map(len, self.sketch[i].values()), dtype=np.int64, count=len(rows))
+        nports = np.fromiter((self.row_ports[i][row].bit_count() for row in rows), dtype=np.int64, count=len(rows))
+        return np.array(rows, dtype=np.int64), ncols, nports
+
+    def col_arrays(self, i):
+        # occupied columns of SSi with the number of rows that contain them
+        cols = np.fromiter(self.sc_frequency[i].keys(), dtype=np.int64, count=len(self.sc_frequency[i]))
+        freq = np.fromiter(self.sc_frequency[i].values(), dtype=np.int64, count=len(self.sc_frequency[i]))
+        return cols, freq
+
+    @instrumented('cal_abrow_list')
     def cal_abrow_list(self):
         # identify abnormal rows
         abrow_list_spreader = []
         abrow_list_changer = []
         new_row_dict = []
-        if self.pre_row_dict is None:
-            for i in range(self.n):
-                abrow_spreader = []
-                new_row_dict.append({})
-                F1i = 0
-                F2i = 0
-                for row in self.sketch[i]:
-                    dci_row = self.cal_dci(i, row)
-                    dpci_row = self.cal_dpci(i, row)
-                    new_row_dict[i][row] = [dci_row, dpci_row]
-                    F1i += dci_row
-                    F2i += dpci_row
-                for row in new_row_dict[i]:
-                    if new_row_dict[i][row][0] >= (self.dt * F1i) or new_row_dict[i][row][1] >= (self.dt * F2i):
-                        abrow_spreader.append(row)
-                abrow_list_spreader.append(abrow_spreader)
-        else:
+        if self.pre_row_dict is not None:
             self.row_change = []
-            for i in range(self.n):
-                abrow_spreader = []
-                abrow_changer = []
-                self.row_change.append({})
-                new_row_dict.append({})
-                C1i = 0
-                C2i = 0
-                F1i = 0
-                F2i = 0
-                for row in self.sketch[i]:
-                    dci_row = self.cal_dci(i, row)
-                    dpci_row = self.cal_dpci(i, row)
-                    new_row_dict[i][row] = [dci_row, dpci_row]
-                    F1i += dci_row
-                    F2i += dpci_row
-                    if row not in self.pre_row_dict[i]:
-                        C1i += dci_row
-                        C2i += dpci_row
-                        self.row_change[i][row] = [dci_row, dpci_row]
-                    else:
-                        change_dci_row = max(0, dci_row - self.pre_row_dict[i][row][0])
-                        change_dpci_row = max(0, dpci_row - self.pre_row_dict[i][row][1])
-                        C1i += change_dci_row
-                        C2i += change_dpci_row
-                        self.row_change[i][row] = [change_dci_row, change_dpci_row]
-                for row in new_row_dict[i]:
-                    if new_row_dict[i][row][0] >= (self.dt * F1i) or new_row_dict[i][row][1] >= (self.dt * F2i):
-                        abrow_spreader.append(row)
-                    if self.row_change[i][row][0] >= (self.ct * C1i) or self.row_change[i][row][1] >= (self.ct * C2i):
-                        abrow_changer.append(row)
-                abrow_list_spreader.append(abrow_spreader)
-                abrow_list_changer.append(abrow_changer)            
+        for i in range(self.n):
+            rows, ncols, nports = self.row_arrays(i)
+            dci = self.dc_array[i][ncols]
+            dpci = self.dpc_array[i][nports]
+            F1i = running_sum(dci)
+            F2i = running_sum(dpci)
+            row_list = rows.tolist()
+            new_row_dict.append(dict(zip(row_list, np.column_stack((dci, dpci)).tolist())))
+            abrow_spreader = rows[(dci >= self.dt * F1i) | (dpci >= self.dt * F2i)]
+            abrow_list_spreader.append(abrow_spreader.tolist())
+            if self.pre_row_dict is not None:
+                # rows that did not exist in the previous epoch change by their whole estimate
+                pre = previous_estimates(self.pre_row_dict[i], rows)
+                change_dci = np.maximum(0, dci - pre[:, 0])
+                change_dpci = np.maximum(0, dpci - pre[:, 1])
+                C1i = running_sum(change_dci)
+                C2i = running_sum(change_dpci)
+                self.row_change.append(dict(zip(row_list, np.column_stack((change_dci, change_dpci)).tolist())))
+                abrow_changer = rows[(change_dci >= self.ct * C1i) | (change_dpci >= self.ct * C2i)]
+                abrow_list_changer.append(abrow_changer.tolist())
         self.pre_row_dict = new_row_dict
         return abrow_list_spreader, abrow_list_changer
 
+    @instrumented('cal_abcol_list')
     def cal_abcol_list(self):
         # identify abnormal columns
         abcol_list_receiver = []
-        new_col_dict = []
         for i in range(self.n):
-            col_set = set()
-            abcol_receiver = []
-            new_col_dict.append({})
-            F3i = 0
-            for row in self.sketch[i]:
-                for col in self.sketch[i][row]:
-                    col_set.add(col)
-            for col in col_set:
-                sci_col = self.cal_sci(i, col)
-                new_col_dict[i][col] = sci_col
-                F3i += sci_col
-            for col in new_col_dict[i]:
-                if new_col_dict[i][col] >= self.dt * F3i:
-                    abcol_receiver.append(col)
-            abcol_list_receiver.append(abcol_receiver)
+            cols, freq = self.col_arrays(i)
+            sci = self.dc_array[i][freq]
+            F3i = running_sum(sci)
+            abcol_list_receiver.append(cols[sci >= self.dt * F3i].tolist())
         return abcol_list_receiver
 
+    def current_suspects(self):
+        # (abrow_list_spreader, abrow_list_changer, abcol_list_receiver) of the epoch so far, like
+        # cal_abrow_list and cal_abcol_list but in O(k) per sub-sketch from the running totals and top-k,
+        # only the top_k rows/columns of each ranking can be returned
+        if self.suspects is None:
+            raise ValueError('current_suspects needs a SuperSketch built with top_k')
+        abrow_list_spreader = [suspects.spreaders(self.dt) for suspects in self.suspects]
+        abrow_list_changer = []
+        if self.suspects[0].pre_rows is not None:
+            abrow_list_changer = [suspects.changers(self.ct) for suspects in self.suspects]
+        abcol_list_receiver = [suspects.receivers(self.dt) for suspects in self.suspects]
+        return abrow_list_spreader, abrow_list_changer, abcol_list_receiver
+
     def dc_change(self, source):
         # calculate the sum of dci(source), i = 1,...,N
         src = addr2dec(source)
@@ -345,12 +727,13 @@ class SuperSketch:
                 dpc_change += 0
         return dpc_change
 
+    @instrumented('anomaly_attribution_sip')
     def anomaly_attribution_sip(self, sip_list):
         # source addresses anomaly attribution
         anomaly_attribution_sip = {}
-        for se in sip_list:
-            dc = self.cal_dc(se)
-            dpc = self.cal_dpc(se)
+        dc_list = self.cal_dc_many(sip_list).tolist()
+        dpc_list = self.cal_dpc_many(sip_list).tolist()
+        for se, dc, dpc in zip(sip_list, dc_list, dpc_list):
             if self.row_change is None:
                 if dc / dpc >= 5:
                     anomaly_type = 'horizontal scan'
@@ -371,12 +754,13 @@ class SuperSketch:
             anomaly_attribution_sip[se] = anomaly_type
         return anomaly_attribution_sip
 
+    @instrumented('anomaly_attribution_dip')
     def anomaly_attribution_dip(self, dip_list):
         # destination addresses anomaly attribution
         anomaly_attribution_dip = {}
-        for des in dip_list:
-            dc = self.cal_dc(des)
-            sc = self.cal_sc(des)
+        dc_list = self.cal_dc_many(dip_list).tolist()
+        sc_list = self.cal_sc_many(dip_list).tolist()
+        for des, dc, sc in zip(dip_list, dc_list, sc_list):
             if dc != 0 and sc / dc > 5:
                 anomaly_type = 'victim'
             else:
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_trace  # noqa: E402
+from main import P_SETS, U_SETS  # noqa: E402
+
+N = 5
+P = P_SETS[0][:N]
+U = U_SETS[0][:N]
+
+
+@pytest.fixture(scope='session')
+def trace():
+    # two small epochs with injected spreaders, receivers and changers
+    return generate_trace(num_flows=20000, epochs=2, num_sources=2000, num_destinations=2000, seed=7)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from adjacency import CSRAdjacency, EdgeLog
+from conftest import N, P, U
+from detect import detect_anomalies
+from supersketch import SuperSketch
+
+
+def test_edge_log_matches_flag_dict():
+    rng = np.random.default_rng(1)
+    keys = rng.integers(0, 50, 2000)
+    keys_next = rng.integers(0, 70, 2000)
+    flag = {}
+    for key, key_next in zip(keys.tolist(), keys_next.tolist()):
+        flag.setdefault(key, set()).add(key_next)
+    log = EdgeLog(70)
+    log.add_edges(keys[:1000], keys_next[:1000])
+    for key, key_next in zip(keys[1000:].tolist(), keys_next[1000:].tolist()):
+        log.add_edge(key, key_next)
+    csr = log.csr()
+    expected = CSRAdjacency.from_dict(flag)
+    assert {key: csr[key] for key in csr} == {key: expected[key] for key in expected}
+
+
+def test_log_flags_detect_the_same_addresses(trace):
+    reports = {}
+    for flags in ('sets', 'log'):
+        ssketch = SuperSketch(N, P, U, flags=flags)
+        ssketch.initialize()
+        reports[flags] = []
+        for src, des, port in trace[0]:
+            ssketch.clear()
+            ssketch.update_batch(src, des, port)
+            reports[flags].append(detect_anomalies(ssketch))
+    assert reports['log'] == reports['sets']
+    assert reports['sets'][1]['spreaders'] and reports['sets'][1]['changers']
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from codec import addr2dec, addrs2dec, dec2addr, decs2addr
+
+
+ADDRESSES = ['0.0.0.0', '255.255.255.255', '10.0.0.1', '192.168.1.254', '1.2.3.4', '001.02.3.040']
+
+
+def test_vector_parsing_matches_scalar():
+    assert addrs2dec(ADDRESSES).tolist() == [addr2dec(addr) for addr in ADDRESSES]
+    assert decs2addr(addrs2dec(ADDRESSES[:5])) == ADDRESSES[:5]
+    assert [dec2addr(dec) for dec in addrs2dec(ADDRESSES[:5])] == ADDRESSES[:5]
+
+
+def test_integer_addresses_pass_through():
+    decs = np.array([0, 1, 0x0a000001, 0xffffffff], dtype=np.uint32)
+    assert addrs2dec(decs).dtype == np.int64
+    assert addrs2dec(decs).tolist() == decs.tolist()
+    assert addr2dec(np.uint32(0x0a000001)) == addr2dec(0x0a000001) == 0x0a000001
+    assert addrs2dec([]).tolist() == []
+
+
+@pytest.mark.parametrize('addr', ['1..3.4', '.1.2.3', '1.2.3.', '1.2.3.999', '256.0.0.1', '1.2.3', '1.2.3.4.5',
+                                  '1.2.3.a', '1.2.3.4444444444444'])
+def test_malformed_addresses_are_rejected(addr):
+    with pytest.raises(ValueError):
+        addr2dec(addr)
+    with pytest.raises(ValueError):
+        addrs2dec(['1.2.3.4', addr])
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import numpy as np
+
+from collector import Collector, replay
+from conftest import N, P, U
+from readers import write_netflow5
+from supersketch import SuperSketch
+from window import WindowedDetector
+
+
+def without_start(reports):
+    # the collector stamps flows with their arrival time, flow-count windows do not depend on it
+    return [{key: value for key, value in report.items() if key != 'start'} for report in reports]
+
+
+async def collect(paths, records):
+    detector = WindowedDetector(SuperSketch(N, P, U), window_flows=15000)
+    # room for every batch, so a slow ingestion thread cannot make the collector drop any
+    collector = Collector(detector, batch_size=4096, max_pending=64)
+    host, port = await collector.start('127.0.0.1', 0)
+    loop = asyncio.get_running_loop()
+    for path in paths:
+        # each replay starts the flow sequence over at 0, like an exporter restart
+        await loop.run_in_executor(None, replay, path, host, port, 20000)
+    deadline = time.monotonic() + 30
+    while collector.records < records and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await collector.stop()
+    return detector, collector
+
+
+def test_loopback_replay_matches_offline_detection(trace, tmp_path):
+    paths = []
+    for k, (src, des, port) in enumerate(trace[0]):
+        paths.append(str(tmp_path / ('epoch%d.nf5' % k)))
+        write_netflow5(paths[-1], src, des, port)
+    records = sum(len(src) for src, des, port in trace[0])
+    detector, collector = asyncio.run(collect(paths, records))
+    counters = collector.counters()
+    assert counters['records'] == records
+    assert counters['lost'] == counters['dropped'] == counters['malformed'] == counters['reordered'] == 0
+    assert counters['restarts'] == 1
+
+    offline = WindowedDetector(SuperSketch(N, P, U), window_flows=15000)
+    for src, des, port in trace[0]:
+        offline.feed(src, des, port)
+    offline.flush()
+    assert without_start(detector.reports) == without_start(offline.reports)
+    assert any(report['spreaders'] for report in offline.reports)
+
+
+def test_sequence_gaps_reorders_and_restarts():
+    collector = Collector(None)
+
+    def receive(sequence, count=30, uptime=5000000):
+        header = np.array([5, count], dtype='>u2').tobytes() + np.array([uptime, 0, 0, sequence], dtype='>u4').tobytes()
+        collector.datagram_received(header + bytes(4 + 48 * count), ('10.0.0.1', 2055))
+
+    collector.queue = asyncio.Queue()
+    receive(1000000)
+    receive(1000060)                # 30 records missing
+    receive(1000030)                # late datagram: the missing records arrived after all
+    receive(1000090)
+    receive(0)                      # restart: the sequence jumped far back
+    receive(30)
+    receive(60, uptime=1000)        # restart: the uptime dropped, the sequence is in order by chance
+    receive(90, uptime=1000)
+    assert (collector.lost, collector.reordered, collector.restarts) == (0, 1, 2)
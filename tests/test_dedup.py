@@ -0,0 +1,40 @@
+import numpy as np
+
+from conftest import N, P, U
+from dedup import DedupFilter
+from supersketch import SuperSketch
+from test_supersketch import state
+
+
+def test_filter_keeps_the_sketch_state(trace):
+    src, des, port = trace[0][0]
+    plain = SuperSketch(N, P, U)
+    plain.initialize()
+    plain.update_batch(src, des, port)
+    filtered = SuperSketch(N, P, U)
+    filtered.dedup = DedupFilter(capacity=1 << 20)
+    filtered.initialize()
+    # every flow twice, once within a batch and once across batches
+    for k in range(0, len(src), 5000):
+        chunk = slice(k, k + 5000)
+        filtered.update_batch(np.tile(src[chunk], 2), np.tile(des[chunk], 2), np.tile(port[chunk], 2))
+    filtered.update_batch(src, des, port)
+    assert state(filtered) == state(plain)
+    assert filtered.dedup.resets == 0
+
+
+def test_hit_ratio_counts_repeats_within_a_batch():
+    rng = np.random.default_rng(5)
+    src = rng.integers(0, 1 << 32, 20000)
+    des = rng.integers(0, 1 << 32, 20000)
+    port = rng.integers(0, 1 << 16, 20000)
+    dedup = DedupFilter(capacity=1 << 20)
+    order = rng.permutation(40000)
+    mask = dedup.fresh(np.tile(src, 2)[order], np.tile(des, 2)[order], np.tile(port, 2)[order])
+    assert mask.sum() == dedup.count == 20000
+    assert dedup.hit_ratio() == 0.5
+    # the first copy of each triple is the fresh one, as the scalar path decides
+    scalar = DedupFilter(capacity=1 << 20)
+    expected = [not scalar.seen(int(s), int(d), int(p))
+                for s, d, p in zip(np.tile(src, 2)[order], np.tile(des, 2)[order], np.tile(port, 2)[order])]
+    assert mask.tolist() == expected
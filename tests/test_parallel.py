@@ -0,0 +1,42 @@
+from benchmark import generate_trace, write_trace
+from conftest import N, P, U
+from detect import Experiment
+from metrics import Metrics
+from parallel import ParallelExperiment
+from supersketch import SuperSketch
+
+
+def run(experiment_class, path, capsys, metrics=None, **kwargs):
+    # printed output and detected addresses of step1
+    experiment = experiment_class(str(path), **kwargs)
+    experiment.metrics = metrics
+    experiment.ssketch = SuperSketch(N, P, U)
+    experiment.ssketch.dt = 0.006
+    experiment.ssketch.ct = 0.004
+    experiment.step1()
+    return capsys.readouterr().out, experiment.spreader_detect, experiment.changer_detect, experiment.receiver_detect
+
+
+def test_parallel_experiment_matches_sequential(tmp_path, capsys):
+    trace, truth = generate_trace(num_flows=20000, epochs=3, num_sources=2000, num_destinations=2000, seed=3)
+    write_trace(trace, tmp_path)
+    sequential = run(Experiment, tmp_path, capsys)
+    parallel = run(ParallelExperiment, tmp_path, capsys, workers=2)
+    assert parallel == sequential
+    assert sequential[1] and sequential[2] and sequential[3]
+
+
+def test_parallel_experiment_records_metrics(tmp_path, capsys):
+    trace, truth = generate_trace(num_flows=5000, epochs=2, num_sources=1000, num_destinations=1000, seed=5)
+    write_trace(trace, tmp_path)
+    sequential = Metrics()
+    parallel = Metrics()
+    run(Experiment, tmp_path, capsys, sequential)
+    run(ParallelExperiment, tmp_path, capsys, parallel, workers=2)
+    assert parallel.counters == sequential.counters
+    assert {name: timer[0] for name, timer in parallel.timers.items()} == \
+        {name: timer[0] for name, timer in sequential.timers.items()}
+    gauges = sequential.snapshot()['gauges']
+    assert gauges['recon_explored'] > 0
+    assert {name: parallel.gauges[name] for name in gauges if name != 'throughput'} == \
+        {name: value for name, value in gauges.items() if name != 'throughput'}
@@ -0,0 +1,20 @@
+import pytest
+
+import planner
+
+
+def test_plan_validates_and_fits_memory():
+    config = planner.plan(200000, 20000, accuracy=0.001, memory=2e9)
+    planner.validate(config['p'], config['u'])
+    assert config['memory'] <= 2e9
+    with pytest.raises(ValueError):
+        planner.plan(200000, 20000, memory=1e6)
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+@pytest.mark.parametrize('flags', ['sets', 'log'])
+def test_predicted_memory_matches_memory_usage(trace, storage, flags):
+    src, des, port = trace[0][0]
+    config = planner.plan(len(src), 2000, accuracy=0.01, storage=storage, flags=flags, n_choices=[5])
+    predicted, measured = planner.calibrate(config, src, des, port)['memory']
+    assert abs(predicted / measured - 1) < 0.1
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmark import write_trace
+from conftest import N, P, U
+from detect import Experiment
+from readers import PCAP_HEADER, encode_pcap, iter_netflow5, iter_pcap, trace_format, write_netflow5, write_pcap
+from supersketch import SuperSketch
+
+
+@pytest.fixture(scope='module')
+def flows():
+    rng = np.random.default_rng(2)
+    count = 200000
+    return (rng.integers(0, 1 << 32, count), rng.integers(0, 1 << 32, count), rng.integers(0, 1 << 16, count),
+            np.sort(rng.uniform(1.7e9, 1.7e9 + 3600, count)))
+
+
+@pytest.mark.parametrize('protocol', [6, 17])
+def test_pcap_round_trip(tmp_path, flows, protocol):
+    src, des, port, timestamps = flows
+    path = str(tmp_path / 'flows.pcap')
+    write_pcap(path, src, des, port, timestamps, protocol)
+    assert trace_format(path) == 'pcap'
+    batches = list(iter_pcap(path, chunksize=30000, timestamps=True))
+    assert [x.tolist() for x in map(np.concatenate, zip(*batches))][:3] == [src.tolist(), des.tolist(), port.tolist()]
+    assert np.abs(np.concatenate([batch[3] for batch in batches]) - timestamps).max() < 1e-5
+
+
+def test_pcap_runs_of_mixed_lengths(tmp_path, flows):
+    src, des, port, timestamps = (x[:20000] for x in flows)
+    # blocks of UDP and TCP packets of random sizes, so runs of one length start and stop anywhere
+    cuts = np.unique(np.random.default_rng(4).integers(1, len(src), 300)).tolist()
+    blocks = zip([0] + cuts, cuts + [len(src)])
+    data = encode_pcap([], [], [])[:PCAP_HEADER] + b''.join(
+        encode_pcap(src[a:b], des[a:b], port[a:b], timestamps[a:b], (6, 17)[k % 2])[PCAP_HEADER:]
+        for k, (a, b) in enumerate(blocks))
+    path = str(tmp_path / 'mixed.pcap')
+    with open(path, 'wb') as f:
+        f.write(data)
+    for chunksize in (1000, 1 << 16):
+        batches = list(iter_pcap(path, chunksize=chunksize))
+        assert [x.tolist() for x in map(np.concatenate, zip(*batches))] == [src.tolist(), des.tolist(), port.tolist()]
+
+
+def test_pcap_fragments_after_the_first_have_no_port(tmp_path, flows):
+    src, des, port, timestamps = (x[:100] for x in flows)
+    data = np.frombuffer(encode_pcap(src, des, port, timestamps), dtype=np.uint8).copy()
+    packets = data[PCAP_HEADER:].reshape(100, -1)
+    packets[0::2, 16 + 20] = 0x20       # more fragments: first fragments keep their ports
+    packets[1::2, 16 + 21] = 0x09       # fragment offset 9, 72 bytes into the datagram
+    path = str(tmp_path / 'fragments.pcap')
+    data.tofile(path)
+    read_src, read_des, read_port = (np.concatenate(x) for x in zip(*iter_pcap(path)))
+    assert read_src.tolist() == src.tolist()
+    assert read_port[0::2].tolist() == port[0::2].tolist()
+    assert not read_port[1::2].any()
+
+
+def test_netflow5_round_trip(tmp_path, flows):
+    src, des, port, timestamps = flows
+    path = str(tmp_path / 'flows.nf5')
+    write_netflow5(path, src, des, port, timestamps)
+    assert trace_format(path) == 'netflow5'
+    batches = list(iter_netflow5(path, chunksize=30000))
+    assert [x.tolist() for x in map(np.concatenate, zip(*batches))] == [src.tolist(), des.tolist(), port.tolist()]
+
+
+def test_truncated_files_stop_at_the_last_whole_record(tmp_path, flows):
+    src, des, port, timestamps = (x[:100] for x in flows)
+    for write, read, name in ((write_pcap, iter_pcap, 'cut.pcap'), (write_netflow5, iter_netflow5, 'cut.nf5')):
+        path = str(tmp_path / name)
+        write(path, src, des, port)
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 10)
+        read_src = np.concatenate([batch[0] for batch in read(path)])
+        assert read_src.tolist() == src[:len(read_src)].tolist() and len(read_src) >= 90
+
+
+def test_experiment_on_pcap_and_netflow5_copies(tmp_path, trace, capsys):
+    outputs = []
+    for kind in ('csv', 'pcap', 'nf5'):
+        # the same file names in every directory, so Experiment lists the epochs in the same order
+        path = tmp_path / kind
+        if kind == 'csv':
+            write_trace(trace[0], path)
+            for name in os.listdir(path):
+                os.rename(path / name, path / name[:-len('.csv')])
+        else:
+            os.makedirs(path)
+            for epoch, (src, des, port) in enumerate(trace[0]):
+                write = write_pcap if kind == 'pcap' else write_netflow5
+                write(str(path / ('epoch%03d' % epoch)), src, des, port)
+        experiment = Experiment(str(path))
+        experiment.ssketch = SuperSketch(N, P, U)
+        experiment.step1()
+        outputs.append((capsys.readouterr().out, experiment.spreader_detect, experiment.changer_detect,
+                        experiment.receiver_detect))
+    assert outputs[1] == outputs[0]
+    assert outputs[2] == outputs[0]
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import N, P, U
+from detect import detect_anomalies
+from shared import QueryPool
+import snapshot
+from supersketch import SuperSketch
+
+
+def second_epoch(trace):
+    # a sketch of the second epoch, compared with the first one for changers
+    ssketch = SuperSketch(N, P, U)
+    ssketch.dt = 0.006
+    ssketch.ct = 0.004
+    ssketch.initialize()
+    ssketch.update_batch(*trace[0][0])
+    detect_anomalies(ssketch)
+    ssketch.clear()
+    ssketch.update_batch(*trace[0][1])
+    return ssketch
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+@pytest.mark.parametrize('mmap', [True, False])
+def test_snapshot_round_trip(trace, tmp_path, storage, mmap):
+    ssketch = SuperSketch(N, P, U, storage)
+    ssketch.initialize()
+    ssketch.update_batch(*trace[0][0])
+    detect_anomalies(ssketch)
+    ssketch.clear()
+    ssketch.update_batch(*trace[0][1])
+    snapshot.save(ssketch, tmp_path / 'epoch.sketch')
+    thawed = snapshot.load(tmp_path / 'epoch.sketch', mmap=mmap).thaw()
+    assert ([{row: {column: set(ports) for column, ports in columns.items()} for row, columns in a.items()}
+             for a in thawed.sketch] ==
+            [{row: {column: set(ports) for column, ports in columns.items()} for row, columns in a.items()}
+             for a in ssketch.sketch])
+    assert thawed.row_ports == ssketch.row_ports
+    assert thawed.sc_frequency == ssketch.sc_frequency
+    assert thawed.Flag_row == ssketch.Flag_row
+    assert thawed.Flag_column == ssketch.Flag_column
+    assert thawed.pre_row_dict == ssketch.pre_row_dict
+    assert (thawed.dt, thawed.ct) == (ssketch.dt, ssketch.ct)
+
+
+def test_snapshot_of_an_empty_sketch(tmp_path):
+    ssketch = SuperSketch(N, P, U)
+    ssketch.initialize()
+    snapshot.save(ssketch, tmp_path / 'empty.sketch')
+    frozen = snapshot.load(tmp_path / 'empty.sketch')
+    assert detect_anomalies(frozen) == detect_anomalies(ssketch)
+    assert frozen.thaw().sketch == ssketch.sketch
+
+
+def test_frozen_detection_is_repeatable(trace, tmp_path):
+    ssketch = second_epoch(trace)
+    snapshot.save(ssketch, tmp_path / 'epoch.sketch')
+    frozen = snapshot.load(tmp_path / 'epoch.sketch')
+    first = detect_anomalies(frozen)
+    assert first['changers']
+    assert detect_anomalies(frozen) == first
+    assert detect_anomalies(ssketch) == first
+
+
+def test_pool_queries_match_live_sketch(trace):
+    ssketch = second_epoch(trace)
+    sources = trace[0][1][0][:1000].tolist()
+    pool = QueryPool(workers=1)
+    try:
+        name = pool.publish(ssketch)
+        # the one worker answers both detections on the same replica
+        reports = [pool.submit(detect_anomalies).result() for k in range(2)]
+        estimates = pool.submit('cal_dc_many', sources).result()
+    finally:
+        pool.close()
+    assert not os.path.exists(os.path.join('/dev/shm', name.lstrip('/')))
+    assert np.array_equal(estimates, ssketch.cal_dc_many(sources))
+    expected = detect_anomalies(ssketch)
+    assert expected['changers']
+    assert reports[0] == expected
+    assert reports[1] == expected
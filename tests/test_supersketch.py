@@ -0,0 +1,219 @@
+import math
+
+import pytest
+
+from codec import dec2addr
+from conftest import N, P, U
+from storage import HotRow
+from supersketch import SuperSketch
+
+
+def state(ssketch):
+    # comparable contents of a sketch
+    return ([{row: {column: set(ports) for column, ports in columns.items()} for row, columns in a.items()}
+             for a in ssketch.sketch], ssketch.row_ports, ssketch.sc_frequency, ssketch.Flag_row,
+            ssketch.Flag_column)
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+def test_update_batch_matches_update(trace, storage):
+    src, des, port = (x[:5000] for x in trace[0][0])
+    scalar = SuperSketch(N, P, U, storage)
+    scalar.initialize()
+    for flow in zip(src.tolist(), des.tolist(), port.tolist()):
+        scalar.update(*flow)
+    batch = SuperSketch(N, P, U, storage)
+    batch.initialize()
+    batch.update_batch(src, des, port)
+    assert state(batch) == state(scalar)
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+def test_merge_matches_single_sketch(trace, storage):
+    src, des, port = trace[0][0]
+    half = len(src) // 2
+    single = SuperSketch(N, P, U, storage)
+    single.initialize()
+    single.update_batch(src, des, port)
+    merged = SuperSketch(N, P, U, storage)
+    merged.initialize()
+    merged.update_batch(src[:half], des[:half], port[:half])
+    other = SuperSketch(N, P, U, storage)
+    other.initialize()
+    other.update_batch(src[half:], des[half:], port[half:])
+    merged.merge(other)
+    assert state(merged) == state(single)
+
+
+def test_parallel_ingest_matches_single_sketch(trace):
+    from parallel import parallel_ingest
+    src, des, port = trace[0][0]
+    single = SuperSketch(N, P, U)
+    single.initialize()
+    single.update_batch(src, des, port)
+    sharded = SuperSketch(N, P, U)
+    sharded.initialize()
+    parallel_ingest(sharded, src, des, port, workers=2, chunks=3)
+    assert state(sharded) == state(single)
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+def test_update_batch_keeps_suspects_up_to_date(trace, storage):
+    src, des, port = trace[0][0]
+    ssketch = SuperSketch(N, P, U, storage, top_k=64, hot_threshold=8)
+    ssketch.initialize()
+    for k in range(0, len(src), 3000):
+        ssketch.update_batch(src[k:k + 3000], des[k:k + 3000], port[k:k + 3000])
+    kept = ssketch.suspects
+    # ties make the kept keys depend on the update order, the top-k scores do not
+    ssketch.build_suspects()
+    for running, rebuilt in zip(kept, ssketch.suspects):
+        assert running.F1 == pytest.approx(rebuilt.F1)
+        assert running.F2 == pytest.approx(rebuilt.F2)
+        assert running.F3 == pytest.approx(rebuilt.F3)
+        assert sorted(running.top_dc.scores) == sorted(rebuilt.top_dc.scores)
+        assert sorted(running.top_dpc.scores) == sorted(rebuilt.top_dpc.scores)
+        assert sorted(running.top_sc.scores) == sorted(rebuilt.top_sc.scores)
+
+
+def test_occupancy_reports_memory(trace):
+    from frozen import freeze
+    ssketch = SuperSketch(N, P, U)
+    ssketch.initialize()
+    ssketch.update_batch(*trace[0][0])
+    assert ssketch.occupancy()['memory_bytes'] == ssketch.memory_usage() > 0
+    frozen = freeze(ssketch)
+    assert frozen.occupancy()['memory_bytes'] == frozen.memory_usage() > 0
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+def test_dense_cache_refresh_and_backlog(trace, storage):
+    src, des, port = trace[0][0]
+    ssketch = SuperSketch(N, P, U, storage)
+    ssketch.initialize()
+    ssketch.update_batch(src[:10000], des[:10000], port[:10000])
+    ssketch.cal_dc_many(src[:10])
+    flows = list(zip(src[10000:].tolist(), des[10000:].tolist(), port[10000:].tolist()))
+    for k, flow in enumerate(flows + flows[:2000]):
+        ssketch.update(*flow)
+        assert all(size <= p // 4 for size, p in zip(ssketch.dirty_size, P))
+        if k % 2500 == 0:
+            ssketch.cal_sc_many(des[:10])
+    fresh = SuperSketch(N, P, U, storage)
+    fresh.initialize()
+    fresh.update_batch(src, des, port)
+    for estimate in ('cal_dc_many', 'cal_dpc_many', 'cal_sc_many'):
+        assert (getattr(ssketch, estimate)(src).tolist() == getattr(fresh, estimate)(src).tolist())
+
+
+def recursive_recon(p, ab_list, flags):
+    # the recursive engine reconstruction replaced, with its per-candidate Chinese remainder solve
+    def crt(remainders):
+        product = math.prod(p)
+        return sum(product // m * pow(product // m, -1, m) * r for m, r in zip(p, remainders)) % product
+
+    def walk(cur, residues, found):
+        if cur == len(p) - 1:
+            found.append(crt(residues))
+            return
+        for flag in flags[cur].get(residues[-1], ()):
+            if flag in ab_list[cur + 1]:
+                walk(cur + 1, residues + [flag], found)
+
+    found = []
+    for num in ab_list[0]:
+        walk(0, [num], found)
+    # the recursive engine wrapped values of 2**32 and above into an address, reconstruction drops them
+    return sorted(dec2addr(x) for x in found if x < 1 << 32)
+
+
+@pytest.mark.parametrize('flags', ['sets', 'log'])
+def test_reconstruction_matches_recursive_engine(trace, flags):
+    ssketch = SuperSketch(N, P, U, flags=flags)
+    ssketch.dt = 0.0005
+    ssketch.ct = 0.0005
+    ssketch.initialize()
+    ssketch.update_batch(*trace[0][0])
+    abrow_list = ssketch.cal_abrow_list()[0]
+    abcol_list = ssketch.cal_abcol_list()
+    flag_row = [flag.csr() for flag in ssketch.Flag_row] if flags == 'log' else ssketch.Flag_row
+    flag_column = [flag.csr() for flag in ssketch.Flag_column] if flags == 'log' else ssketch.Flag_column
+    spreaders = ssketch.recon_sip(abrow_list)
+    receivers = ssketch.recon_dip(abcol_list)
+    assert spreaders and receivers
+    assert sorted(spreaders) == recursive_recon(P, abrow_list, flag_row)
+    assert sorted(receivers) == recursive_recon(P, abcol_list, flag_column)
+
+
+def test_recon_counters_are_per_epoch(trace):
+    from detect import detect_anomalies
+    ssketch = SuperSketch(N, P, U)
+    ssketch.initialize()
+    ssketch.update_batch(*trace[0][0])
+    detect_anomalies(ssketch)
+    explored = ssketch.occupancy()['recon_explored']
+    assert explored > 0
+    ssketch.clear()
+    assert ssketch.occupancy()['recon_explored'] == 0
+    ssketch.pre_row_dict = None
+    ssketch.update_batch(*trace[0][0])
+    detect_anomalies(ssketch)
+    assert ssketch.occupancy()['recon_explored'] == explored
+
+
+def test_max_candidates_is_an_epoch_budget(trace):
+    ssketch = SuperSketch(N, P, U, max_candidates=8)
+    ssketch.dt = 0.0005
+    ssketch.ct = 0.0005
+    ssketch.initialize()
+    for _ in range(2):
+        ssketch.update_batch(*trace[0][0])
+        ssketch.recon_sip(ssketch.cal_abrow_list()[0])
+        ssketch.recon_dip(ssketch.cal_abcol_list())
+        # both directions share the budget, what is past it is counted as truncated
+        assert ssketch.reconstructor.kept == 8
+        assert ssketch.reconstructor.truncated > 0
+        ssketch.clear()
+        assert ssketch.reconstructor.kept == 0
+
+
+def detection_state(ssketch, sources, destinations):
+    # estimates, abnormal rows/columns and reconstructed addresses of a sketch, in a layout-independent order
+    spreader_rows, changer_rows = ssketch.cal_abrow_list()
+    receiver_columns = ssketch.cal_abcol_list()
+    return ([getattr(ssketch, estimate)(sources).tolist() for estimate in ('cal_dc_many', 'cal_dpc_many')],
+            ssketch.cal_sc_many(destinations).tolist(), [ssketch.cal_dc(x) for x in sources[:200].tolist()],
+            [sorted(rows) for rows in spreader_rows], [sorted(rows) for rows in changer_rows],
+            [sorted(columns) for columns in receiver_columns],
+            sorted(ssketch.recon_sip(spreader_rows)), sorted(ssketch.recon_dip(receiver_columns)))
+
+
+@pytest.mark.parametrize('storage', ['dict', 'compact'])
+def test_hot_rows_match_exact_mode(trace, storage, tmp_path):
+    import snapshot
+    src, des, port = trace[0][0]
+    exact = SuperSketch(N, P, U, storage)
+    exact.initialize()
+    exact.update_batch(src, des, port)
+    hot = SuperSketch(N, P, U, storage, hot_threshold=8)
+    hot.initialize()
+    hot.update_batch(src, des, port)
+    assert any(type(columns) is HotRow for a in hot.sketch for columns in a.values())
+    # a snapshot keeps the hot rows and their estimates
+    snapshot.save(hot, tmp_path / 'hot.sketch')
+    expected = detection_state(exact, src, des)
+    assert expected[6] and expected[7]
+    assert detection_state(hot, src, des) == expected
+    assert detection_state(snapshot.load(tmp_path / 'hot.sketch'), src, des) == expected
+
+    # merge with HotRows on one side only, in both directions
+    half = len(src) // 2
+    for first, second in ((8, None), (None, 8)):
+        merged = SuperSketch(N, P, U, storage, hot_threshold=first)
+        merged.initialize()
+        merged.update_batch(src[:half], des[:half], port[:half])
+        other = SuperSketch(N, P, U, storage, hot_threshold=second)
+        other.initialize()
+        other.update_batch(src[half:], des[half:], port[half:])
+        merged.merge(other)
+        assert detection_state(merged, src, des) == expected
@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import N, P, U
+from detect import detect_anomalies
+from metrics import Metrics
+from supersketch import SuperSketch
+import window
+from window import DoubleBufferedDetector, WindowedDetector
+
+
+def sketches(count):
+    return [SuperSketch(N, P, U) for i in range(count)]
+
+
+def test_double_buffered_matches_windowed(trace):
+    src, des, port = (np.concatenate(x) for x in zip(*trace[0]))
+    plain = WindowedDetector(sketches(1)[0], window_flows=20000)
+    plain.feed(src, des, port)
+    plain.flush()
+    double = DoubleBufferedDetector(sketches(2), window_flows=20000)
+    double.feed(src, des, port)
+    double.close()
+    assert [report['spreaders'] for report in double.reports] == [report['spreaders'] for report in plain.reports]
+    assert [report['changers'] for report in double.reports] == [report['changers'] for report in plain.reports]
+
+
+def test_double_buffered_reraises_worker_errors(trace):
+    src, des, port = trace[0][0]
+
+    def on_report(report):
+        raise RuntimeError('report sink failed')
+
+    detector = DoubleBufferedDetector(sketches(2), window_flows=5000, on_report=on_report)
+    errors = []
+
+    def feed():
+        try:
+            detector.feed(src, des, port)
+        except RuntimeError as error:
+            errors.append(error)
+
+    # the feeding thread gets the error instead of blocking on a dead worker
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    feeder.join(30)
+    assert not feeder.is_alive()
+    assert errors
+    with pytest.raises(RuntimeError):
+        detector.close()
+    assert not detector.worker.is_alive()
+
+
+def test_double_buffered_suspects_use_the_previous_window(trace):
+    # the fourth window is open, its sketch was last cleared after analyzing the second one
+    src, des, port = (np.concatenate(x)[:35000] for x in zip(*trace[0]))
+    plain = WindowedDetector(SuperSketch(N, P, U, top_k=1024), window_flows=10000)
+    plain.feed(src, des, port)
+    double = DoubleBufferedDetector([SuperSketch(N, P, U, top_k=1024) for i in range(2)], window_flows=10000)
+    double.feed(src, des, port)
+    expected = plain.suspects()
+    found = double.suspects()
+    double.close()
+    assert expected['changers']
+    for key in ('spreaders', 'changers', 'receivers', 'window'):
+        assert found[key] == expected[key]
+
+
+def test_time_windows_advance_past_boundary_timestamps():
+    # flows stamped exactly on window boundaries, where floor division can fall one window short
+    detector = WindowedDetector(sketches(1)[0], window_seconds=2.071102910919154)
+    detector.feed([1, 2], [3, 4], [5, 6], [450435.85833799513, 450483.49370494625])
+    detector.flush()
+    assert [report['flows'] for report in detector.reports] == [1, 1]
+    assert [report['window'] for report in detector.reports] == [0, 1]
+
+    rng = np.random.default_rng(3)
+    index = np.unique(rng.integers(0, 1000, 200))
+    timestamps = np.round((1.7e9 + 0.1 * index) * 1e6) / 1e6   # microsecond pcap timestamps
+    detector = WindowedDetector(sketches(1)[0], window_seconds=0.1)
+    for k in range(0, len(index), 50):
+        detector.feed(index[k:k + 50], index[k:k + 50], index[k:k + 50], timestamps[k:k + 50])
+    detector.flush()
+    # one window per flow, each starting on the grid of the first timestamp
+    assert [report['flows'] for report in detector.reports] == [1] * len(index)
+    starts = np.array([report['start'] for report in detector.reports])
+    assert np.allclose(starts, timestamps[0] + 0.1 * (index - index[0]), rtol=0, atol=1e-6)
+
+
+def test_double_buffered_reraises_analysis_errors(trace):
+    src, des, port = trace[0][0]
+    ssketches = sketches(2)
+    for ssketch in ssketches:
+        ssketch.dt = None
+    # the worker process fails on the threshold, its exception is re-raised in the parent
+    detector = DoubleBufferedDetector(ssketches, window_flows=10000)
+    detector.feed(src[:15000], des[:15000], port[:15000])
+    with pytest.raises(TypeError):
+        detector.close()
+    assert not detector.worker.is_alive()
+    assert detector.free.qsize() == 1
+
+
+def test_double_buffered_merges_the_analysis_metrics(trace, monkeypatch):
+    src, des, port = (np.concatenate(x)[:30000] for x in zip(*trace[0]))
+    explored = []
+
+    def counted(ssketch):
+        report = detect_anomalies(ssketch)
+        explored.append(ssketch.reconstructor.explored)
+        return report
+
+    # the patch only reaches the windows analyzed in this process
+    monkeypatch.setattr(window, 'detect_anomalies', counted)
+    plain = WindowedDetector(sketches(1)[0], window_flows=10000)
+    plain.ssketch.metrics = Metrics()
+    plain.feed(src, des, port)
+    metrics = Metrics()
+    ssketches = sketches(2)
+    for ssketch in ssketches:
+        ssketch.metrics = metrics
+    double = DoubleBufferedDetector(ssketches, window_flows=10000)
+    double.feed(src, des, port)
+    double.close()
+    assert len(explored) == 3
+    assert metrics.counters['recon_explored'] == sum(explored) > 0
+    assert all(ssketch.reconstructor.explored == 0 for ssketch in ssketches)
+    for name, timer in plain.ssketch.metrics.timers.items():
+        assert metrics.timers[name][0] == timer[0]
@@ -0,0 +1,141 @@
+class TopK:
+    # the k keys with the largest scores, as a min-heap of size k indexed by key
+    # scores may only grow between clears, so a key left out never outranks the smallest one kept
+    # and the k largest stay exact
+
+    def __init__(self, k):
+        self.k = k
+        self.keys = []
+        self.scores = []
+        self.position = {}  # key: index in the heap
+
+    def update(self, key, score):
+        # raise the score of a key
+        i = self.position.get(key)
+        if i is not None:
+            self.scores[i] = score
+            self.sift_down(i)
+        elif len(self.keys) < self.k:
+            self.keys.append(key)
+            self.scores.append(score)
+            self.position[key] = len(self.keys) - 1
+            self.sift_up(len(self.keys) - 1)
+        elif self.k and score > self.scores[0]:
+            del self.position[self.keys[0]]
+            self.keys[0] = key
+            self.scores[0] = score
+            self.position[key] = 0
+            self.sift_down(0)
+
+    def swap(self, i, j):
+        keys, scores = self.keys, self.scores
+        keys[i], keys[j] = keys[j], keys[i]
+        scores[i], scores[j] = scores[j], scores[i]
+        self.position[keys[i]] = i
+        self.position[keys[j]] = j
+
+    def sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) >> 1
+            if self.scores[parent] <= self.scores[i]:
+                break
+            self.swap(i, parent)
+            i = parent
+
+    def sift_down(self, i):
+        size = len(self.keys)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self.scores[child] < self.scores[smallest]:
+                    smallest = child
+            if smallest == i:
+                break
+            self.swap(i, smallest)
+            i = smallest
+
+    def at_least(self, threshold):
+        # keys scoring at least threshold, largest first
+        found = [(score, key) for score, key in zip(self.scores, self.keys) if score >= threshold]
+        return [key for score, key in sorted(found, reverse=True)]
+
+    def clear(self):
+        self.keys = []
+        self.scores = []
+        self.position = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.position
+
+
+def union(keys, more):
+    # keys followed by the keys of more not already in it
+    seen = set(keys)
+    return keys + [key for key in more if key not in seen]
+
+
+class SuspectIndex:
+    # running F1i/F2i/F3i totals of a sub-sketch SSi and the top-k rows by dci, dpci and their change since
+    # the previous epoch, and the top-k columns by sci, kept up to date as rows and columns grow
+
+    def __init__(self, dc_table, dpc_table, k, pre_rows=None):
+        self.dc_table = dc_table
+        self.dpc_table = dpc_table
+        self.pre_rows = pre_rows    # {row: [dci, dpci]} of the previous epoch, no changers if None
+        self.F1 = 0.0
+        self.F2 = 0.0
+        self.F3 = 0.0
+        self.C1 = 0.0
+        self.C2 = 0.0
+        self.top_dc = TopK(k)
+        self.top_dpc = TopK(k)
+        self.top_sc = TopK(k)
+        self.top_change_dc = TopK(k)
+        self.top_change_dpc = TopK(k)
+
+    def row_columns(self, row, before, after):
+        # the row went from before to after columns
+        old = self.dc_table[before]
+        new = self.dc_table[after]
+        self.F1 += new - old
+        self.top_dc.update(row, new)
+        if self.pre_rows is not None:
+            pre = self.pre_rows.get(row, (0, 0))[0]
+            change = max(0, new - pre)
+            self.C1 += change - max(0, old - pre)
+            if change:
+                self.top_change_dc.update(row, change)
+
+    def row_ports(self, row, before, after):
+        # the port bitmap of the row went from before to after bits
+        old = self.dpc_table[before]
+        new = self.dpc_table[after]
+        self.F2 += new - old
+        self.top_dpc.update(row, new)
+        if self.pre_rows is not None:
+            pre = self.pre_rows.get(row, (0, 0))[1]
+            change = max(0, new - pre)
+            self.C2 += change - max(0, old - pre)
+            if change:
+                self.top_change_dpc.update(row, change)
+
+    def column_rows(self, column, before, after):
+        # the column went from before to after rows
+        new = self.dc_table[after]
+        self.F3 += new - self.dc_table[before]
+        self.top_sc.update(column, new)
+
+    def spreaders(self, dt):
+        # rows with dci >= dt * F1i or dpci >= dt * F2i among the top k
+        return union(self.top_dc.at_least(dt * self.F1), self.top_dpc.at_least(dt * self.F2))
+
+    def changers(self, ct):
+        # rows whose dci or dpci grew by at least ct of the total change since the previous epoch
+        return union(self.top_change_dc.at_least(ct * self.C1), self.top_change_dpc.at_least(ct * self.C2))
+
+    def receivers(self, dt):
+        # columns with sci >= dt * F3i among the top k
+        return self.top_sc.at_least(dt * self.F3)
@@ -0,0 +1,239 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+
+from detect import detect_anomalies, detect_suspects
+from metrics import Metrics
+from parallel import row_tables
+import shared
+
+
+class WindowedDetector:
+    # continuous detection over one flow stream, closing an epoch every window_seconds or window_flows
+
+    def __init__(self, ssketch, window_seconds=None, window_flows=None, on_report=None):
+        if window_seconds is None and window_flows is None:
+            raise ValueError('window_seconds or window_flows is required')
+        self.ssketch = ssketch
+        self.window_seconds = window_seconds
+        self.window_flows = window_flows
+        self.on_report = on_report      # called with each window's report, reports are kept in self.reports if None
+        self.reports = []
+        self.window = 0                 # number of the current window
+        self.window_start = None        # start time of the current window
+        self.origin = None              # time windows are [origin + k * window_seconds, origin + (k+1) * ...)
+        self.index = 0                  # k of the current time window
+        self.flows = 0                  # flows ingested in the current window
+        self.ssketch.clear()
+
+    def feed(self, src, des, port, timestamps=None):
+        # ingest a batch of flows, timestamps in seconds (non-decreasing), the arrival time if None
+        src = np.asarray(src)
+        des = np.asarray(des)
+        port = np.asarray(port)
+        if timestamps is None:
+            timestamps = np.full(len(src), time.time())
+        timestamps = np.asarray(timestamps, dtype=float)
+        start = 0
+        while start < len(src):
+            if self.window_start is None:
+                self.start_at(float(timestamps[start]))
+            end = len(src)
+            if self.window_seconds is not None:
+                end = start + int(np.searchsorted(timestamps[start:], self.boundary(self.index)))
+            if self.window_flows is not None:
+                end = min(end, start + self.window_flows - self.flows)
+            if end > start:
+                self.ssketch.update_batch(src[start:end], des[start:end], port[start:end])
+                self.flows += end - start
+            if end < len(src) or (self.window_flows is not None and self.flows >= self.window_flows):
+                self.rotate(float(timestamps[end]) if end < len(src) else None)
+            start = end
+
+    def rotate(self, next_time=None):
+        # close the current window: detect, report and clear the sketch in place
+        report = detect_anomalies(self.ssketch)
+        report.update(window=self.window, start=self.window_start, flows=self.flows)
+        self.ssketch.clear()
+        self.advance(next_time)
+        self.emit(report)
+        return report
+
+    def advance(self, next_time):
+        # start the next window, at next_time if known, else at the next flow fed
+        self.window += 1
+        self.flows = 0
+        self.window_start = None
+        if next_time is not None:
+            self.start_at(next_time)
+
+    def boundary(self, index):
+        # end of time window index, computed from the origin so rounding errors do not add up
+        return self.origin + (index + 1) * self.window_seconds
+
+    def start_at(self, first):
+        # open the window holding a flow at time first, skipping the time windows without any flow
+        if self.window_seconds is None:
+            self.window_start = first
+            return
+        if self.origin is None:
+            self.origin = first
+        # the division only guesses the index, the boundaries decide it
+        index = max(self.index, int((first - self.origin) // self.window_seconds))
+        while index > self.index and first < self.boundary(index - 1):
+            index -= 1
+        while first >= self.boundary(index):
+            index += 1
+        if index > self.index:
+            self.index = index
+            self.window_start = self.boundary(index - 1)
+        else:
+            # first window, or the flow limit split the time window: the rest of it starts at this flow
+            self.window_start = first
+
+    def suspects(self):
+        # anomalies of the current, open window so far, the sketch must be built with top_k
+        # changers are relative to the previous window, analyzed before the sketch was cleared
+        report = detect_suspects(self.ssketch)
+        report.update(window=self.window, start=self.window_start, flows=self.flows)
+        return report
+
+    def emit(self, report):
+        if self.on_report is None:
+            self.reports.append(report)
+        else:
+            self.on_report(report)
+
+    def flush(self):
+        # close the last, partial window
+        if self.flows:
+            return self.rotate()
+
+
+def analyze_window(name, timed):
+    # worker process: detect the anomalies of a closed window published in shared memory, return the report,
+    # the row estimates the next window compares against and, if timed, the timers and counters of the analysis
+    ssketch = shared.attach(name)
+    try:
+        ssketch.metrics = Metrics() if timed else None
+        report = detect_anomalies(ssketch)
+        tables = row_tables(ssketch)
+        recorded = None
+        if timed:
+            reconstructor = ssketch.reconstructor
+            ssketch.metrics.count('recon_explored', reconstructor.explored)
+            ssketch.metrics.count('recon_pruned', reconstructor.pruned)
+            ssketch.metrics.count('recon_truncated', reconstructor.truncated)
+            recorded = ssketch.metrics.timers, ssketch.metrics.counters
+        return report, tables, recorded
+    finally:
+        shared.detach(ssketch)
+
+
+def start_method():
+    # a fresh interpreter per worker: fork is unsafe in a process running threads and missing on Windows
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class DoubleBufferedDetector(WindowedDetector):
+    # WindowedDetector that swaps in a fresh sketch at each boundary and analyzes the closed one in a worker
+    # process, so the analysis does not hold the GIL of the ingesting thread
+    # a background thread publishes each closed window to shared memory (shared.publish), returns the sketch
+    # to ingestion and has the worker detect on the frozen copy, in order, chaining the row estimates
+    # (RowTables) from one window to the next; ingestion blocks only when analysis falls more than
+    # max_pending windows behind
+    # the timers of the analysis and the reconstruction counters (recon_explored, recon_pruned and
+    # recon_truncated, summed over windows) are merged into the metrics of the analyzed sketch
+    # an exception raised by the analysis or by on_report is re-raised by the next rotate() or close()
+
+    def __init__(self, ssketches, window_seconds=None, window_flows=None, on_report=None, max_pending=1):
+        super().__init__(ssketches[0], window_seconds, window_flows, on_report)
+        self.free = queue.Queue()                       # cleared sketches ready for ingestion
+        for ssketch in ssketches[1:]:
+            ssketch.clear()
+            self.free.put(ssketch)
+        self.pending = queue.Queue(maxsize=max_pending)  # closed windows waiting for analysis
+        self.pre_row_dict = self.ssketch.pre_row_dict    # row estimates of the last analyzed window
+        self.stalls = 0             # boundaries at which ingestion had to wait for analysis
+        self.stall_seconds = 0.0
+        self.error = None           # first exception of the worker, not raised yet
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(start_method()))
+        self.worker = threading.Thread(target=self.analyze, daemon=True)
+        self.worker.start()
+
+    def rotate(self, next_time=None):
+        # hand the closed window to the worker and continue with a free sketch
+        self.raise_error()
+        begin = time.perf_counter()
+        stalled = self.pending.full() or self.free.empty()
+        self.pending.put((self.ssketch, self.window, self.window_start, self.flows))
+        self.ssketch = self.free.get()
+        if stalled:
+            self.stalls += 1
+            self.stall_seconds += time.perf_counter() - begin
+        self.advance(next_time)
+
+    def analyze(self):
+        # worker thread: publish closed windows in order, free their sketch and analyze them in the worker process
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            ssketch, window, start, flows = item
+            metrics = ssketch.metrics
+            report = None
+            segment = None
+            try:
+                ssketch.pre_row_dict = self.pre_row_dict
+                segment = shared.publish(ssketch)
+            except Exception as error:
+                self.error = self.error or error
+            # the sketch goes back to ingestion whatever happened, so rotate() never waits for a dead worker
+            ssketch.clear()
+            self.free.put(ssketch)
+            if segment is not None:
+                try:
+                    report, self.pre_row_dict, recorded = self.executor.submit(
+                        analyze_window, segment.name, metrics is not None).result()
+                    report.update(window=window, start=start, flows=flows)
+                    if recorded is not None:
+                        metrics.merge(*recorded)
+                except Exception as error:
+                    self.error = self.error or error
+                finally:
+                    segment.close()
+                    segment.unlink()
+            self.pending.task_done()
+            if report is not None:
+                try:
+                    self.emit(report)
+                except Exception as error:
+                    self.error = self.error or error
+
+    def suspects(self):
+        # the sketch taken from free was cleared against the window it analyzed, two windows back by now:
+        # wait for the analysis of the previous window and compare the open one with its row estimates
+        self.pending.join()
+        self.raise_error()
+        self.ssketch.set_previous(self.pre_row_dict)
+        return super().suspects()
+
+    def raise_error(self):
+        # re-raise the first exception of the worker in the calling thread
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        # analyze the last, partial window, wait for the worker to finish and raise its exception if any
+        try:
+            self.flush()
+        finally:
+            self.pending.put(None)
+            self.worker.join()
+            self.executor.shutdown()
+        self.raise_error()